@@ -0,0 +1,134 @@
+''' Time-harmonic animation of the field of a mode (or a superposition of modes).
+
+    A distance z along the waveguide and at time t the field is
+        Re(F(rho, phi) exp(i(wt - kz z)))
+    so the complex field at z is worked out once, and each frame is just
+    Re(F)*cos(wt) - Im(F)*sin(wt) of the arrow components. Only the arrows are
+    redrawn each frame (blitting).
+
+    Can also be run headless, saving the animation to a .gif (or a video,
+    .mp4 etc. if ffmpeg is installed) e.g.
+        python animation.py --mode TE --m 1 --n 1 --c 3.2 --out te11.gif '''
+
+if __name__ == '__main__':
+    # headless: use a non-interactive backend before pyplot is imported
+    import matplotlib
+    matplotlib.use('Agg')
+
+import os
+
+from numpy import arange, arctan2, cos, sin, empty, multiply, pi
+from matplotlib.animation import FuncAnimation
+
+from superposition import Superposition
+
+
+def peak_phase(real, imag):
+    ''' the time phase wt at which the field (U, V) = Re((real + i imag) exp(i wt))
+        is largest overall. Its squared size goes as
+            (|R|^2 + |I|^2)/2 + (|R|^2 - |I|^2)/2*cos(2wt) - R.I*sin(2wt) '''
+    a = (real**2).sum() - (imag**2).sum()
+    b = (real*imag).sum()
+    return arctan2(-2*b, a)/2.
+
+
+class FieldAnimation:
+    ''' Animates the field arrows of a mode (TEmode / TMmode / TEMmode or
+        Superposition) through one period, at a distance z along the guide '''
+
+    def __init__(self, mode, n_rho=15, n_phi=60, z=0., frames=48):
+        self.mode = mode
+        self.n_rho, self.n_phi = n_rho, n_phi
+        if not isinstance(mode, Superposition):
+            mode = Superposition([mode])
+        # only the arrow components (E_x, E_y, H_x, H_y) are animated
+        F = mode.complex_fields(n_rho, n_phi, z)[6:]
+        self.real, self.imag = F.real.copy(), F.imag.copy()
+        self.phases = 2*pi*arange(frames)/float(frames)
+
+        # every frame is worked out in the same arrays
+        self.values = empty(self.real.shape)
+        self.temp = empty(self.real.shape)
+        self.animation = None
+
+    def frame(self, phase):
+        ''' (E_x, E_y, H_x, H_y) at time phase wt. The array is reused by the
+            next frame '''
+        multiply(self.real, cos(phase), out=self.values)
+        self.values -= multiply(self.imag, sin(phase), out=self.temp)
+        return self.values
+
+    def setup(self, ax):
+        ''' plot the mode's field arrows in ax (unless they're already there),
+            with the arrow length scale fixed to fit the largest frame '''
+        mode = self.mode
+        if mode.field_ax is not ax or mode.field_grid != (self.n_rho, self.n_phi):
+            mode.plot_field(ax, n_rho=self.n_rho, n_phi=self.n_phi)
+        ax = mode.field_ax
+
+        # show each field at its peak, and let the quiver scale itself to that
+        for quiver, i in [(mode.E_field, 0), (mode.H_field, 2)]:
+            values = self.frame(peak_phase(self.real[i:i+2], self.imag[i:i+2]))
+            quiver.scale = None
+            quiver.set_UVC(values[i], values[i+1])
+        ax.figure.canvas.draw()
+        return ax
+
+    def update(self, i):
+        ''' show the ith frame, returns the artists that changed (for blitting) '''
+        E_x, E_y, H_x, H_y = self.frame(self.phases[i % len(self.phases)])
+        self.mode.E_field.set_UVC(E_x, E_y)
+        self.mode.H_field.set_UVC(H_x, H_y)
+        return [self.mode.E_field, self.mode.H_field]
+
+    def start(self, ax, interval=40):
+        ''' start animating in ax, a frame every interval ms '''
+        self.stop()
+        ax = self.setup(ax)
+        self.animation = FuncAnimation(ax.figure, self.update, frames=len(self.phases),
+                                       interval=interval, blit=True)
+        return self.animation
+
+    def stop(self):
+        ''' stop animating (the arrows are left as they are) '''
+        if self.animation is not None:
+            self.animation.event_source.stop()
+            self.animation = None
+
+    def save(self, filename, ax, fps=25, dpi=None):
+        ''' save one period of the animation in ax to filename: .gif is written
+            with Pillow, anything else (e.g. .mp4) with ffmpeg '''
+        if self.animation is None:
+            self.start(ax)
+        writer = 'pillow' if os.path.splitext(filename)[1].lower() == '.gif' else 'ffmpeg'
+        self.animation.save(filename, writer=writer, fps=fps, dpi=dpi)
+
+
+if __name__ == '__main__':
+    import argparse
+    import matplotlib.pyplot as plt
+    from coaxial_modes import TEmode, TMmode, TEMmode
+
+    parser = argparse.ArgumentParser(description='save an animation of a mode\'s field')
+    parser.add_argument('--mode', default='TE', choices=['TE', 'TM', 'TEM'])
+    parser.add_argument('--m', type=int, default=1)
+    parser.add_argument('--n', type=int, default=1)
+    parser.add_argument('--c', type=float, required=True)
+    parser.add_argument('--z', type=float, default=0., help='distance along the guide')
+    parser.add_argument('--n-rho', type=int, default=15, help='number of radial points')
+    parser.add_argument('--n-phi', type=int, default=60, help='number of polar points')
+    parser.add_argument('--frames', type=int, default=48, help='frames per period')
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--out', default='field.gif', help='output file (.gif, .mp4 ...)')
+    args = parser.parse_args()
+
+    if args.mode == 'TEM':
+        mode = TEMmode(args.c)
+    else:
+        mode = {'TE': TEmode, 'TM': TMmode}[args.mode](args.m, args.n, args.c)
+        mode.find_root()
+
+    fig = plt.figure()
+    animation = FieldAnimation(mode, args.n_rho, args.n_phi, args.z, args.frames)
+    animation.save(args.out, fig.add_subplot(111), fps=args.fps)
+    print('%s: %s' % (args.out, mode))
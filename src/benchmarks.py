@@ -0,0 +1,222 @@
+''' Benchmarks of the hot paths: root solves, batch root tables, field
+    evaluation, the root equation plot range and (headless) field plotting.
+
+    Results are saved to a JSON file under the git revision they were run at,
+    so a change can be checked for slowdowns against an earlier revision.
+
+    e.g.
+        python benchmarks.py                     # run them all, save under HEAD
+        python benchmarks.py --filter field      # just the field benchmarks
+        python benchmarks.py --compare abc1234   # and compare with revision abc1234 '''
+
+# plotting benchmarks are run headless
+import matplotlib
+matplotlib.use('Agg')
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from timeit import default_timer
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from coaxial_modes import TEmode, TMmode
+from root_zoom_plot import RootZoomPlot
+from waveguide_batch import cutoff_table
+
+# default file the results are kept in
+DEFAULT_FILENAME = 'benchmarks.json'
+
+# keep timing a benchmark until it has taken at least this long (seconds)
+MIN_TIME = 0.2
+
+
+def solved_mode(mode, m, n, c=3.2):
+    ''' a TEmode / TMmode with its root found '''
+    mode = {'TE': TEmode, 'TM': TMmode}[mode](m, n, c)
+    mode.find_root()
+    return mode
+
+def bench_root(mode, m, n):
+    ''' solve the root of a single mode '''
+    guide = {'TE': TEmode, 'TM': TMmode}[mode](m, n, 3.2)
+    return guide.find_root
+
+def bench_table():
+    ''' a batch table of TE and TM roots, 21 m x 10 n x 6 c each '''
+    m, n, c = range(21), range(1, 11), [1.5, 2, 2.5, 3, 3.5, 4]
+    return lambda: cutoff_table(['TE', 'TM'], m, n, c)
+
+def bench_fields(n_rho, n_phi):
+    ''' all the field components of a mode on an n_rho x n_phi grid '''
+    mode = solved_mode('TE', 2, 1)
+    return lambda: mode.field_arrows(n_rho, n_phi)
+
+def bench_ylim(Npoints=4096):
+    ''' the y range of the root equation plot from Npoints samples '''
+    mode = solved_mode('TE', 10, 3)
+    # only the samples are needed, not a real (interactive) plot
+    plot = RootZoomPlot.__new__(RootZoomPlot)
+    plot.x = np.linspace(0, 4*mode.root, Npoints)
+    with np.errstate(all='ignore'):
+        plot.y = mode.root_equation(mode.m, mode.c, plot.x)
+    return plot.get_ylim
+
+def bench_plot_field(update):
+    ''' render the field plot (15 x 60 arrows) with the Agg backend, either
+        from scratch or updating the arrows of an existing plot '''
+    mode = solved_mode('TM', 2, 1)
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    def run():
+        mode.plot_field(ax if not update else mode.field_ax)
+        fig.canvas.draw()
+    run()
+    return run
+
+def bench_import(module):
+    ''' cold start: a new python process importing module (None if the module
+        can't be imported here, e.g. the viewer without PyQt4) '''
+    command = [sys.executable, '-c', 'import ' + module]
+    directory = os.path.dirname(os.path.abspath(__file__))
+    with open(os.devnull, 'w') as null:
+        if subprocess.call(command, cwd=directory, stdout=null, stderr=null) != 0:
+            return None
+    return lambda: subprocess.check_call(command, cwd=directory)
+
+# name -> function setting up the benchmark, returning the function to time
+BENCHMARKS = [
+    ('root TE m=1 n=1', lambda: bench_root('TE', 1, 1)),
+    ('root TM m=1 n=1', lambda: bench_root('TM', 1, 1)),
+    ('root TE m=40 n=20', lambda: bench_root('TE', 40, 20)),
+    ('root TM m=40 n=20', lambda: bench_root('TM', 40, 20)),
+    ('table TE+TM 21x10x6', bench_table),
+    ('fields 15x60', lambda: bench_fields(15, 60)),
+    ('fields 100x400', lambda: bench_fields(100, 400)),
+    ('fields 1000x1000', lambda: bench_fields(1000, 1000)),
+    ('get_ylim 4096', bench_ylim),
+    ('plot_field new', lambda: bench_plot_field(False)),
+    ('plot_field update', lambda: bench_plot_field(True)),
+    ('python start up', lambda: bench_import('sys')),
+    ('import coaxial_modes', lambda: bench_import('coaxial_modes')),
+    ('import waveguide_batch', lambda: bench_import('waveguide_batch')),
+    ('import waveguide_viewer', lambda: bench_import('waveguide_viewer')),
+    ]
+
+
+def time_function(function, repeat=5, min_time=MIN_TIME):
+    ''' best and mean time (seconds) of a single call of function, over repeat
+        runs of enough calls to take at least min_time '''
+    # how many calls make a run
+    number = 1
+    while True:
+        start = default_timer()
+        for i in range(number):
+            function()
+        elapsed = default_timer() - start
+        if elapsed >= min_time or number >= 10**6:
+            break
+        number *= 10 if elapsed < min_time/10. else 2
+
+    times = [elapsed/number]
+    for i in range(repeat-1):
+        start = default_timer()
+        for j in range(number):
+            function()
+        times.append((default_timer() - start)/number)
+    return {'best': min(times), 'mean': sum(times)/len(times), 'number': number}
+
+def run(names=None, repeat=5, min_time=MIN_TIME, output=sys.stdout):
+    ''' run the benchmarks (all of them, or those named), returns a dict of
+        name -> timing (see time_function) '''
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names is not None and name not in names:
+            continue
+        function = setup()
+        if function is None:
+            if output is not None:
+                output.write('%-24s skipped\n' % name)
+            continue
+        results[name] = time_function(function, repeat, min_time)
+        plt.close('all')
+        if output is not None:
+            output.write('%-24s %s\n' % (name, format_time(results[name]['best'])))
+    return results
+
+def format_time(seconds):
+    ''' e.g. 12.3 ms '''
+    for unit, scale in [('s', 1), ('ms', 1e-3), ('us', 1e-6)]:
+        if seconds >= scale:
+            break
+    return '%.3g %s' % (seconds/scale, unit)
+
+def git_revision():
+    ''' short hash of the checked out revision (+ "-dirty" if there are
+        uncommitted changes), or "unknown" if it's not a git repository '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        with open(os.devnull, 'w') as null:
+            revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                               cwd=directory, stderr=null).decode().strip()
+            changes = subprocess.check_output(['git', 'status', '--porcelain', '-uno'],
+                                              cwd=directory, stderr=null).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return revision + ('-dirty' if changes else '')
+
+def load(filename):
+    ''' saved results, revision -> {'date': ..., 'results': ...} '''
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+def save(filename, revision, results):
+    ''' add (or update) the results of a revision in filename '''
+    saved = load(filename)
+    entry = saved.setdefault(revision, {'results': {}})
+    entry['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    entry['results'].update(results)
+    with open(filename, 'w') as f:
+        json.dump(saved, f, indent=1, sort_keys=True)
+
+def compare(old, new, output=sys.stdout):
+    ''' table of the best times of two sets of results, with the ratio new/old '''
+    output.write('%-24s %12s %12s %8s\n' % ('', 'old', 'new', 'ratio'))
+    for name, setup in BENCHMARKS:
+        if name not in old or name not in new:
+            continue
+        a, b = old[name]['best'], new[name]['best']
+        output.write('%-24s %12s %12s %8.2f\n' % (name, format_time(a), format_time(b), b/a))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the waveguide mode calculations')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks with this in their name')
+    parser.add_argument('--repeat', type=int, default=5, help='runs of each benchmark')
+    parser.add_argument('--file', default=DEFAULT_FILENAME, help='results file (.json)')
+    parser.add_argument('--revision', default=None,
+                        help='save the results under this name (default: git revision)')
+    parser.add_argument('--compare', default=None, metavar='REVISION',
+                        help='compare the results with those saved for REVISION')
+    parser.add_argument('--no-save', action='store_true', help="don't save the results")
+    args = parser.parse_args()
+
+    names = [name for name, setup in BENCHMARKS if args.filter in name]
+    results = run(names, args.repeat)
+    revision = args.revision or git_revision()
+    if not args.no_save:
+        save(args.file, revision, results)
+        sys.stdout.write('saved to %s as %s\n' % (args.file, revision))
+
+    if args.compare is not None:
+        saved = load(args.file)
+        if args.compare not in saved:
+            sys.exit('no results for %s in %s' % (args.compare, args.file))
+        compare(saved[args.compare]['results'], results)
@@ -0,0 +1,37 @@
+''' Vectorized sign change scans of sampled functions, used both to bracket the
+    roots of the radial root equations and to pick nice plot ranges for them.
+    Samples that have overflowed to inf / nan (Bessel functions diverge as
+    x->0) never count as a sign change. '''
+
+import numpy as np
+
+
+def finite_signs(y):
+    ''' +1/-1 for the sign of each sample. Zeros count as positive, and
+        samples that are inf / nan get 0 (no sign) '''
+    return np.where(np.isfinite(y), np.where(y<0, -1, 1), 0)
+
+def sign_changes(y, axis=-1):
+    ''' boolean array (one shorter along axis) that is True between neighbouring
+        samples of opposite sign, i.e. where there's a root in between.
+        Works on a single 1d array of samples or e.g. one row per function '''
+    signs = finite_signs(y)
+    n = signs.shape[axis]
+    left = np.take(signs, np.arange(n-1), axis=axis)
+    right = np.take(signs, np.arange(1, n), axis=axis)
+    return left*right < 0
+
+def first_sign_change(y, start=0):
+    ''' index of the first sample (from start on) whose sign is opposite to the
+        first signed sample from start on, or -1 if the sign never changes.
+        Zeros and inf / nan samples are skipped over '''
+    y = np.asarray(y)[start:]
+    # positions of the samples that have a definite sign
+    signed = np.flatnonzero(np.isfinite(y) & (y != 0))
+    if signed.size < 2:
+        return -1
+    signs = y[signed] > 0
+    changed = signs[1:] != signs[0]
+    if not changed.any():
+        return -1
+    return start + signed[1 + changed.argmax()]
@@ -5,20 +5,33 @@ electric and magnetic fields propagating through a coaxial/(annulus) waveguide
 
 # my errors
 from waveguide_viewer_errors import NotGreaterThenZero, NotGreaterThenOne, NotGreaterThenOrEqualToOne             
-# my plotting functions
-from interactive_plot import DragRoot, ZoomPlot
-from root_zoom_plot import RootZoomPlot
+# sign change scans for bracketing roots
+from bracketing import sign_changes
+# cache of sampled root equation values
+from sampling import SampleCache
+# (opt-in) timings and counters
+import instrumentation
+from instrumentation import timed
+# priority queue for listing modes in order of cutoff
+from heapq import heappush, heappop
+# my plotting functions (interactive_plot, root_zoom_plot) and matplotlib are
+# only imported by the plotting methods when they're first used, so finding
+# roots and fields (e.g. in batch jobs / sweep worker processes) doesn't 
+# load any plotting libraries
 
 # numpy stuff
 from numpy import array, arange, zeros, linspace, any, all
 from numpy import pi, ndarray, sin, cos, meshgrid, sqrt
-
-# plotting tools
-import matplotlib.pyplot as plt
+from numpy import asarray, broadcast_arrays, where, nan, isfinite, errstate
+from numpy import unique, column_stack, concatenate, searchsorted, maximum
+from numpy import empty, broadcast, multiply, divide
+from numpy import arccos, minimum, split
 
 # Bessel functions and derivatives
 from scipy.special import jn, yn, jvp, yvp
-from scipy.optimize import newton
+# polynomial approximations of the radial functions
+from numpy.polynomial.chebyshev import Chebyshev
+from numpy.random import RandomState
 
 # Wavelength of light (m)
 LAMBDA = 1e-6
@@ -28,13 +41,788 @@ K = 2*pi/LAMBDA             # wavenumber k (m-1)
 OMEGA = C*K                 # Waveguide Frequency (s-1)
 MU = 1.25663706e-6          # the magnetic constant (m kg s-2 A-2)
 EPSILON = 8.85418782e-12    # permittivity of free space (m-3 kg-1 s4 A2)
+# (these are the defaults: each mode carries its own wavelength, permittivity
+# and permeability, see TMmode.set_medium)
+
+
+# Dispersion of the modes in a medium (epsilon, mu). These work on whole
+# arrays (e.g. of frequencies) at once. omega is the angular frequency, and
+# wavelengths are free space wavelengths 2 pi C/omega
+def refractive_index(epsilon=EPSILON, mu=MU):
+    ''' n = sqrt(epsilon mu/(epsilon_0 mu_0)) of the medium filling the guide '''
+    return sqrt(epsilon*mu/(EPSILON*MU))
+
+def wavenumber(omega, epsilon=EPSILON, mu=MU):
+    ''' k = omega sqrt(epsilon mu) in the medium '''
+    return omega/C*refractive_index(epsilon, mu)
+
+def cutoff_frequency(chi, epsilon=EPSILON, mu=MU):
+    ''' angular frequency below which the mode with root chi doesn't propagate '''
+    return chi*C/refractive_index(epsilon, mu)
+
+def cutoff_wavelength(chi, epsilon=EPSILON, mu=MU):
+    ''' (free space) wavelength above which the mode with root chi doesn't propagate '''
+    with errstate(divide='ignore'):
+        return 2*pi*refractive_index(epsilon, mu)/chi
+
+def dispersion(chi, omega, epsilon=EPSILON, mu=MU):
+    ''' (kz, group velocity, propagating) of the mode with root chi at each
+        angular frequency omega (arrays, broadcast against each other).
+        kz^2 = k^2 - chi^2: kz is real when the mode propagates, and -i alpha
+        when it's evanescent (so exp(-i kz z) decays as exp(-alpha z)). The
+        group velocity d omega/d kz = (C/n)^2 kz/omega is 0 when evanescent '''
+    k = wavenumber(omega, epsilon, mu)
+    kz2 = k**2 - chi**2
+    propagating = kz2 > 0
+    size = sqrt(abs(kz2))
+    kz = empty(kz2.shape, dtype=complex)
+    kz.real = where(propagating, size, 0.)
+    kz.imag = where(propagating, 0., -size)
+    with errstate(all='ignore'):
+        group_velocity = where(propagating, (C/refractive_index(epsilon, mu))**2*size/omega, 0.)
+    return kz, group_velocity, propagating
+
+# names of the field components returned (in this order) by the fields() method
+# of each mode: the six polar components, then the Cartesian x/y projections
+FIELD_COMPONENTS = ('E_rho', 'E_phi', 'E_z', 'H_rho', 'H_phi', 'H_z', 
+                    'E_x', 'E_y', 'H_x', 'H_y')
+
+# Optional root_cache.RootCache that find_root looks roots up in before solving
+# (set with root_cache.enable())
+ROOT_CACHE = None
+
+
+# Radial root equations and their x derivatives. These live at module level
+# (rather than only as methods) so they can be evaluated over whole arrays of
+# m, c and x at once by the batch root solver.
+
+def bessel_and_dash(m, x):
+    ''' J_m(x), J'_m(x), Y_m(x), Y'_m(x), sharing the Bessel function 
+        evaluations by using J'_m(x) = J_m-1(x) - m/x*J_m(x) (and likewise for Y'_m) '''
+    J, Y = jn(m,x), yn(m,x)
+    return J, jn(m-1,x) - m/x*J, Y, yn(m-1,x) - m/x*Y
+
+def bessel_dash2(m, x, Z, Z_dash):
+    ''' Z''(x) of a Bessel function Z of order m, given Z(x) and Z'(x),
+        from Bessel's equation x^2 Z'' + x Z' + (x^2 - m^2) Z = 0 '''
+    return -Z_dash/x - (1 - (m/x)**2)*Z
+
+def tm_root_equation(m, c, x):
+    'Radial root equation of Phi for TM mode'
+    return yn(m,x)*jn(m,c*x)-jn(m,x)*yn(m,c*x)
+
+def tm_root_equation_dash(m, c, x):
+    'derivative with respect to x of the TM radial root equation'
+    return (yvp(m,x,1)*jn(m,c*x) + c*yn(m,x)*jvp(m,c*x,1)
+            - jvp(m,x,1)*yn(m,c*x) - c*jn(m,x)*yvp(m,c*x,1))
+
+def te_root_equation(m, c, x):
+    'Radial root equation of Phi for TE mode'
+    J_dash, Y_dash = bessel_and_dash(m, x)[1::2]
+    Jc_dash, Yc_dash = bessel_and_dash(m, c*x)[1::2]
+    return Y_dash*Jc_dash - J_dash*Yc_dash
+
+def te_root_equation_dash(m, c, x):
+    'derivative with respect to x of the TE radial root equation'
+    return (yvp(m,x,2)*jvp(m,c*x,1) + c*yvp(m,x,1)*jvp(m,c*x,2)
+            - jvp(m,x,2)*yvp(m,c*x,1) - c*jvp(m,x,1)*yvp(m,c*x,2))
+
+def tm_root_equation_dc(m, c, x):
+    'derivative with respect to c of the TM radial root equation'
+    return x*(yn(m,x)*jvp(m,c*x,1) - jn(m,x)*yvp(m,c*x,1))
+
+def te_root_equation_dc(m, c, x):
+    'derivative with respect to c of the TE radial root equation'
+    return x*(yvp(m,x,1)*jvp(m,c*x,2) - jvp(m,x,1)*yvp(m,c*x,2))
+
+# The root equations together with their x derivatives, for Newton's method.
+# f and f' share the same four Bessel functions of order m and m-1 at x and c*x
+# (the second derivatives TE needs come from Bessel's equation), rather than 
+# evaluating every jvp / yvp separately
+
+def tm_root_equation_and_dash(m, c, x):
+    ''' the TM radial root equation and its x derivative, as a pair '''
+    J, J_dash, Y, Y_dash = bessel_and_dash(m, x)
+    Jc, Jc_dash, Yc, Yc_dash = bessel_and_dash(m, c*x)
+    return (Y*Jc - J*Yc,
+            Y_dash*Jc + c*Y*Jc_dash - J_dash*Yc - c*J*Yc_dash)
+
+def te_root_equation_and_dash(m, c, x):
+    ''' the TE radial root equation and its x derivative, as a pair '''
+    J, J_dash, Y, Y_dash = bessel_and_dash(m, x)
+    Jc, Jc_dash, Yc, Yc_dash = bessel_and_dash(m, c*x)
+    J_dash2, Y_dash2 = bessel_dash2(m, x, J, J_dash), bessel_dash2(m, x, Y, Y_dash)
+    Jc_dash2, Yc_dash2 = bessel_dash2(m, c*x, Jc, Jc_dash), bessel_dash2(m, c*x, Yc, Yc_dash)
+    return (Y_dash*Jc_dash - J_dash*Yc_dash,
+            Y_dash2*Jc_dash + c*Y_dash*Jc_dash2 - J_dash2*Yc_dash - c*J_dash*Yc_dash2)
+
+# Asymptotic approximations of the roots, used as initial guesses.
+# McMahon's expansion (Abramowitz & Stegun 9.5.28 / 9.5.31) 
+#     chi = beta + p/beta + (q-p^2)/beta^3 + ...
+# is very good while its corrections are small (many oscillations across the 
+# guide, small m), and is used while p/beta^2 is below MCMAHON_LIMIT.
+# Otherwise (high m) the WKB / Debye phase condition is solved: the phase of 
+# the radial function across the guide
+#     Phi(chi) = int sqrt(chi^2 - nu^2/rho^2) drho,  nu^2 = m^2 - 1/4 (Langer)
+# taken over the oscillating part (rho from max(1, nu/chi) to c) is n*pi for 
+# TM, (n-1)*pi for TE, less / plus pi/4 if there's a turning point in the guide
+MCMAHON_LIMIT = 0.02
+
+def mcmahon_root(mode, m, n, c):
+    ''' McMahon's asymptotic expansion for the roots (works on arrays), nan 
+        where it doesn't apply (TE n=1, m>0) '''
+    mu = 4.*m**2
+    if mode == 'TM':
+        beta = n*pi/(c-1.)
+        p = (mu-1)/(8.*c)
+        q = 4*(mu-1)*(mu-25)*(c**3-1)/(3*(8.*c)**3*(c-1))
+    else:
+        beta = (n-1.)*pi/(c-1.)
+        p = (mu+3)/(8.*c)
+        q = 4*(mu**2+46*mu-63)*(c**3-1)/(3*(8.*c)**3*(c-1))
+    with errstate(all='ignore'):
+        return where(beta > 0, beta + p/beta + (q-p**2)/beta**3, nan)
+
+def wkb_phase(x, nu, c):
+    ''' (Phi(x), dPhi/dx) the WKB phase of the radial function across the guide,
+        using the antiderivative sqrt(x^2 rho^2 - nu^2) - nu*arccos(nu/(x rho)) '''
+    # (with u = nu/(x rho) the antiderivative is nu*(sqrt(1-u^2)/u - arccos(u)),
+    # evaluated between rho = c and rho = max(1, nu/x), i.e. u = min(1, nu/x))
+    with errstate(all='ignore'):
+        u_c = minimum(nu/(c*x), 1.)
+        u_lo = minimum(nu/x, 1.)
+        s_c, s_lo = sqrt(1-u_c**2), sqrt(1-u_lo**2)
+        phase = c*x*s_c - x*s_lo - nu*(arccos(u_c) - arccos(u_lo))
+        return phase, c*s_c - s_lo
+
+def wkb_solve(target, nu, c, iterations=50):
+    ''' x with wkb_phase(x, nu, c) = target (arrays), by Newton's method kept 
+        inside a bracket [nu/c, upper bound] (bisecting if it steps outside) '''
+    target, nu, c = broadcast_arrays(asarray(target, dtype=float), 
+                                     asarray(nu, dtype=float), asarray(c, dtype=float))
+    # Phi(x) >= (c-1)*sqrt(x^2 - nu^2) gives the upper bound
+    a, b = nu/c, sqrt((target/(c-1.))**2 + nu**2)
+    x = b.copy()
+    for i in range(iterations):
+        phase, slope = wkb_phase(x, nu, c)
+        low = phase < target
+        a, b = where(low, x, a), where(low, b, x)
+        with errstate(all='ignore'):
+            x_new = x - (phase-target)/slope
+        done = abs(x_new - x) <= 1e-10*x
+        x = where(done | ((x_new > a) & (x_new < b)), x_new, (a+b)/2.)
+        if all(done): break
+    return x
+
+def wkb_root(mode, m, n, c):
+    ''' root of the WKB phase condition (works on arrays) '''
+    m, n, c = broadcast_arrays(asarray(m, dtype=float), asarray(n, dtype=float), 
+                               asarray(c, dtype=float))
+    shape = m.shape
+    m, n, c = m.ravel(), n.ravel(), c.ravel()
+    nu = sqrt(maximum(m**2 - 0.25, 0))
+    # the phase is n*pi for TM, (n-1)*pi for TE, unless there's a turning point
+    # in the guide (at rho = nu/x > 1): then it's (n-1/4)*pi or (n-3/4)*pi
+    phases = {'TM': (0., 0.25), 'TE': (1., 0.75)}[mode]
+    x = wkb_solve((n-phases[0])*pi, nu, c)
+    turning = nu > x
+    if any(turning):
+        x[turning] = wkb_solve((n[turning]-phases[1])*pi, nu[turning], c[turning])
+    return x.reshape(shape)
+
+def asymptotic_root(mode, m, n, c):
+    ''' McMahon's expansion where it's accurate, otherwise the WKB root '''
+    m, n, c = broadcast_arrays(asarray(m), asarray(n), asarray(c, dtype=float))
+    if mode == 'TE':
+        # TE m=0 roots are those of TM m=1 (as J0' = -J1)
+        zero = m == 0
+        if any(zero):
+            x = asymptotic_root('TM', where(zero, 1, m), n, c)
+            if all(zero): return x
+            return where(zero, x, asymptotic_root('TE', where(zero, 1, m), n, c))
+    mu = 4.*m**2
+    beta = (n - (mode=='TE'))*pi/(c-1.)
+    with errstate(all='ignore'):
+        use_mcmahon = abs(mu+3)/(8.*c*beta**2) < MCMAHON_LIMIT
+    if all(use_mcmahon):
+        return mcmahon_root(mode, m, n, c)
+    x = wkb_root(mode, m, n, c)
+    if any(use_mcmahon):
+        x = where(use_mcmahon, mcmahon_root(mode, m, n, c), x)
+    return x
 
+def tm_guess_root(m, n, c):
+    'Guess the root chi_mn for TM mode (works on arrays)'
+    return asymptotic_root('TM', m, n, c)
 
-class TMmode:
+def te_guess_root(m, n, c):
+    'Guess the root chi_mn for TE mode (works on arrays)'
+    return asymptotic_root('TE', m, n, c)
+
+# root equation, its derivative and initial guess for each mode type
+ROOT_EQUATIONS = {'TM': (tm_root_equation, tm_root_equation_dash, tm_guess_root),
+                  'TE': (te_root_equation, te_root_equation_dash, te_guess_root)}
+# the derivative of the root equation with respect to c, for following roots as c changes
+ROOT_EQUATIONS_DC = {'TM': tm_root_equation_dc, 'TE': te_root_equation_dc}
+# the root equation and its x derivative evaluated together (for Newton's method)
+ROOT_EQUATIONS_AND_DASH = {'TM': tm_root_equation_and_dash, 'TE': te_root_equation_and_dash}
+
+
+# number of samples of the root equation per (asymptotic) root spacing pi/(c-1)
+# used when scanning for sign changes. Neighbouring roots are never closer than
+# this spacing, so 8 samples per spacing can't step over a pair of roots
+SAMPLES_PER_ROOT = 8
+# number of samples evaluated per scan window
+SCAN_WINDOW = 256
+# give up looking for a root after this many scan windows
+MAX_SCAN_WINDOWS = 1000
+
+
+def root_scan_start(m, c):
+    ''' the smallest x worth scanning for roots. chi^2 is an eigenvalue of the 
+        radial equation, which can't be less than min(m^2/rho^2) = (m/c)^2, and
+        below this x the Bessel functions diverge / overflow '''
+    return where(m==0, 1e-3, m/c)
+
+def root_scan_step(c, samples_per_root=SAMPLES_PER_ROOT):
+    ''' x spacing to sample the root equation at when bracketing roots '''
+    return pi/(c-1.)/samples_per_root
+
+def count_roots(mode, m, c, x, samples_per_root=SAMPLES_PER_ROOT):
+    ''' number of roots of the radial root equation between 0 and x 
+        (by counting sign changes) for a single mode '''
+    f = ROOT_EQUATIONS[mode][0]
+    x_lo = float(root_scan_start(m, c))
+    if x <= x_lo: return 0
+    dx = root_scan_step(c, samples_per_root)
+    xs = linspace(x_lo, x, int((x-x_lo)/dx)+2)
+    with errstate(all='ignore'):
+        return int(sign_changes(f(m, c, xs)).sum())
+
+def bracket_roots(mode, m, n, c, samples_per_root=SAMPLES_PER_ROOT):
+    ''' Find an interval [a,b] containing the nth root for each (m, n, c).
+        The root equation of each distinct (m, c) is sampled once over 
+        successive windows of x (all of them at once), counting sign changes 
+        until the largest n asked for is reached.
+        m, n, c = 1d arrays of the same length
+        returns a, b, f(a) arrays; entries where no bracket was found are nan '''
+    f = ROOT_EQUATIONS[mode][0]
+    
+    # only scan each (m, c) pair once, as far as its largest n
+    pairs, inverse = unique(column_stack((m, c)), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    m_u, c_u = pairs[:,0], pairs[:,1]
+    n_max = zeros(len(pairs), dtype=int)
+    maximum.at(n_max, inverse, n)
+    
+    x_start = root_scan_start(m_u, c_u).astype(float)
+    dx = root_scan_step(c_u, samples_per_root)
+    found = zeros(len(pairs), dtype=int)    # sign changes counted so far
+    active = arange(len(pairs))             # pairs still being scanned
+    steps = arange(SCAN_WINDOW+1)
+    # (pair, root number, a, b, f(a)) for every bracket found
+    brackets = []
+    
+    for i in range(MAX_SCAN_WINDOWS):
+        if active.size == 0: break
+        # sample each active pair over its next window (windows share end points)
+        x = x_start[active,None] + dx[active,None]*steps[None,:]
+        with errstate(all='ignore'):
+            y = f(m_u[active,None], c_u[active,None], x)
+        if instrumentation.ENABLED:
+            instrumentation.count('root equation samples', y.size)
+        changes = sign_changes(y, axis=1)
+        # running total of sign changes, the kth change brackets the kth root
+        count = changes.cumsum(axis=1) + found[active,None]
+        rows, j = (changes & (count <= n_max[active,None])).nonzero()
+        brackets.append((active[rows], count[rows,j], 
+                         x[rows,j], x[rows,j+1], y[rows,j]))
+        
+        # move the rest onto the next window
+        found[active] = count[:,-1]
+        x_start[active] = x[:,-1]
+        active = active[found[active] < n_max[active]]
+    
+    # look up the bracket of each requested root (there may be none at all, 
+    # e.g. if no roots were asked for)
+    if not brackets:
+        return zeros(n.size)+nan, zeros(n.size)+nan, zeros(n.size)+nan
+    pair, number, a, b, fa = [concatenate(column) for column in zip(*brackets)]
+    if pair.size == 0:
+        return zeros(n.size)+nan, zeros(n.size)+nan, zeros(n.size)+nan
+    keys = pair*(n_max.max()+1) + number
+    order = keys.argsort()
+    wanted = inverse*(n_max.max()+1) + n
+    index = order[searchsorted(keys[order], wanted).clip(0, keys.size-1)]
+    ok = keys[index] == wanted
+    
+    return where(ok, a[index], nan), where(ok, b[index], nan), where(ok, fa[index], nan)
+
+def polish_roots(mode, m, c, a, b, fa, tol=1e-12, maxiter=100, x0=None):
+    ''' Refine bracketed roots a < root < b with Newton's method, using the 
+        analytic derivative of the root equation. Any Newton step that would 
+        leave the bracket is replaced by bisection, so this always converges.
+        m, c, a, b, fa = 1d arrays of the same length, fa = f(a)
+        x0 = starting guesses (optional), used where they're inside the bracket,
+        otherwise Newton starts from the middle of the bracket '''
+    f_and_dash = ROOT_EQUATIONS_AND_DASH[mode]
+    a, b, fa = a.copy(), b.copy(), fa.copy()
+    x = (a+b)/2.
+    if x0 is not None:
+        x = where((x0 > a) & (x0 < b), x0, x)
+    
+    # indices of roots still being iterated on (unbracketed roots stay nan)
+    active = isfinite(x).nonzero()[0]
+    for i in range(maxiter):
+        if active.size == 0: break
+        m_a, c_a, x_a = m[active], c[active], x[active]
+        with errstate(all='ignore'):
+            y, y_dash = f_and_dash(m_a, c_a, x_a)
+            x_new = x_a - y/y_dash
+        if instrumentation.ENABLED:
+            instrumentation.count('newton iterations', active.size)
+        
+        # shrink the bracket around the root
+        left = (y<0) == (fa[active]<0)
+        a[active] = where(left, x_a, a[active])
+        fa[active] = where(left, y, fa[active])
+        b[active] = where(left, b[active], x_a)
+        
+        # bisect if Newton jumps outside the bracket
+        a_a, b_a = a[active], b[active]
+        outside = ~((x_new > a_a) & (x_new < b_a))
+        x_new = where(outside, (a_a+b_a)/2., x_new)
+        x[active] = x_new
+        
+        # drop the roots that have converged from the active set
+        scale = abs(x_new).clip(1, None)
+        converged = (abs(x_new-x_a) <= tol*scale) | (b_a-a_a <= tol*scale) | (y==0)
+        x[active[y==0]] = x_a[y==0]
+        active = active[~converged]
+    
+    return x
+
+def find_roots(mode, m, n, c, tol=1e-12, maxiter=100, 
+               samples_per_root=SAMPLES_PER_ROOT):
+    ''' Solve for the roots chi_mn of many TE or TM modes at once.
+        mode = 'TE' or 'TM'
+        m, n, c = integers / floats or arrays of them, broadcast against each other
+        Returns an array (of the broadcast shape) of roots. The nth root is 
+        found by counting sign changes of the root equation, then polished with
+        a bracketed Newton's method; roots that can't be found are returned as nan '''
+    if mode not in ROOT_EQUATIONS:
+        raise ValueError('mode must be one of %s' % sorted(ROOT_EQUATIONS))
+    
+    m, n, c = broadcast_arrays(asarray(m), asarray(n), asarray(c, dtype=float))
+    # make sure values are valid
+    if any(m<0):
+        raise NotGreaterThenZero('m must be non-negative')
+    if any(n<1):
+        raise NotGreaterThenOrEqualToOne('n must be >= 1')
+    if any(c<=1):
+        raise NotGreaterThenOne('c must be greater then 1')
+    
+    shape = m.shape
+    m, n, c = m.ravel(), n.ravel(), c.ravel()
+    a, b, fa = bracket_roots(mode, m, n, c, samples_per_root)
+    # start Newton from the asymptotic guesses, which are usually much closer
+    # to the root than the middle of its bracket
+    x0 = ROOT_EQUATIONS[mode][2](m, n, c)
+    x = polish_roots(mode, m, c, a, b, fa, tol, maxiter, x0)
+    return x.reshape(shape)
+
+def trace_root(mode, m, n, c_start, c_end, step=None, max_step=None, 
+               tol=1e-12, check_every=20):
+    ''' Follow the root chi_mn(c) of a single mode from c_start to c_end by 
+        continuation, returning the curve as arrays (c, chi).
+        Each step predicts the next root along the tangent 
+            dchi/dc = -(df/dc)/(df/dx)
+        and corrects it with Newton's method at the new c. Steps grow while 
+        the corrector converges quickly, and are halved if it doesn't or if the
+        correction is so large the root may have jumped to a neighbouring 
+        branch (n-1 or n+1). Every check_every steps the branch is confirmed by
+        counting the roots below chi; if it's wrong the curve is rewound to the
+        last confirmed point. If the step gets too small the next point is 
+        solved from scratch with find_roots.
+        step, max_step = initial / largest step in c (default 1% / 10% of the range) '''
+    f_and_dash = ROOT_EQUATIONS_AND_DASH[mode]
+    f_dc = ROOT_EQUATIONS_DC[mode]
+    
+    span = abs(c_end - c_start)
+    direction = 1 if c_end > c_start else -1
+    step = step or span/100.
+    max_step = max_step or span/10.
+    min_step = 1e-6*step
+    h = step
+    
+    chi = float(find_roots(mode, m, n, c_start))
+    curve_c, curve_chi = [c_start], [chi]
+    checked = 0     # index of the last point known to be on the right branch
+    
+    while direction*(c_end - curve_c[-1]) > 0:
+        c, chi = curve_c[-1], curve_chi[-1]
+        h = min(h, abs(c_end - c))
+        c_new = c + direction*h
+        
+        if h < min_step:
+            # continuation is stuck, solve this point from scratch
+            h = step
+            x, converged, iterations = float(find_roots(mode, m, n, c_new)), True, 0
+        else:
+            # predictor: follow the tangent of the curve
+            x_predicted = x = chi - direction*h*f_dc(m,c,chi)/f_and_dash(m,c,chi)[1]
+            # corrector: Newton's method at the new c
+            converged = False
+            for iterations in range(1, 9):
+                y, y_dash = f_and_dash(m,c_new,x)
+                dx = y/y_dash
+                x -= dx
+                if abs(dx) <= tol*max(1, abs(x)):
+                    converged = True
+                    break
+            # roots are about pi/(c-1) apart, a big correction may have landed 
+            # on the neighbouring root
+            converged = converged and abs(x-x_predicted) < 0.25*pi/(c_new-1)
+        
+        if not (converged and isfinite(x)):
+            h /= 2.
+            continue
+        curve_c.append(c_new)
+        curve_chi.append(x)
+        if iterations <= 3:
+            h = min(1.5*h, max_step)
+        
+        # make sure we're still following the nth root
+        at_end = direction*(c_end - c_new) <= 0
+        if len(curve_c)-1-checked >= check_every or at_end:
+            if count_roots(mode, m, c_new, x*(1-1e-9)) == n-1:
+                checked = len(curve_c)-1
+            else:
+                # wrong branch, go back to the last good point with smaller steps
+                del curve_c[checked+1:], curve_chi[checked+1:]
+                h /= 4.
+    
+    return array(curve_c), array(curve_chi)
+
+def find_root_near(mode, m, c, x):
+    ''' the root of a single mode closest to x, returned as (n, root) '''
+    # k roots lie below x, so the nearest root is number k or k+1
+    k = count_roots(mode, m, c, x)
+    candidates = find_roots(mode, m, array([max(k,1), k+1]), c)
+    i = abs(candidates-x).argmin()
+    return max(k,1) + i, candidates[i]
+
+# most roots of each chain (m) solved at first when listing modes, doubled
+# as more are needed, and the most m values whose chains are started together
+CHAIN_START = 4
+CHAIN_BLOCK = 64
+# propagating_modes won't list more modes than this unless given max_modes
+MAX_MODES = 10**6
+
+def chain_lengths(mode, m, c, k, lo, hi):
+    ''' how many roots the chains of m (an array) need to reach k: one past 
+        the last root below k going by the asymptotic guesses, kept between lo 
+        and hi (arrays, or numbers) '''
+    guesses = ROOT_EQUATIONS[mode][2](m[:,None], arange(1, max(hi)+1)[None,:], c)
+    return ((guesses < k).sum(axis=1) + 1).clip(lo, hi)
+
+def solve_chain(mode, m, n, c, k, chains):
+    ''' chi_mn, keeping the roots chi_m1, chi_m2 ... of each (mode, m) solved so
+        far in chains[(mode, m)].
+        A new chain starts with up to CHAIN_START roots (fewer if the asymptotic
+        guesses say fewer are below k), in the same (vectorized) scan as those 
+        of the next m values, as many as came before it (up to CHAIN_BLOCK), if
+        their first roots look to be below k.
+        A chain at most doubles whenever a root past its end is needed. The 
+        walk will need every other chain ending below the new end of this one
+        extended before it gets there, so they're extended (as far as that) 
+        in the same scan '''
+    chain = chains.get((mode, m))
+    if chain is not None and chain.size >= n:
+        return chain[n-1]
+    
+    if chain is None:
+        size = 1 if mode == 'TE' and m == 0 else min(max(m, 1), CHAIN_BLOCK)
+        m_block = arange(m, m+size)
+        numbers = chain_lengths(mode, m_block, c, k, 1, [max(n, CHAIN_START)])
+        numbers[0] = max(numbers[0], n)
+        # (the other m values only if their first root looks to be below k)
+        keep = numbers > 1
+        keep[0] = True
+        m_block, numbers = m_block[keep], numbers[keep]
+        sizes = zeros(m_block.size, dtype=int)
+    else:
+        number = chain_lengths(mode, array([m]), c, k, n, [max(n, 2*chain.size)])[0]
+        # (about where the walk will be when it reaches the end of this chain)
+        target = min(float(ROOT_EQUATIONS[mode][2](m, number, c)), k)
+        others = [(i, other.size) for (name, i), other in chains.items() 
+                  if name == mode and i != m and other[-1] < target]
+        m_block = array([m] + [i for i, size in others])
+        sizes = array([chain.size] + [size for i, size in others])
+        numbers = chain_lengths(mode, m_block, c, target, sizes+1, 2*sizes)
+        numbers[0] = number
+    
+    # only solve the roots the chains don't have yet
+    n_all = concatenate([arange(size+1, number+1) for size, number in zip(sizes, numbers)])
+    roots = find_roots(mode, m_block.repeat(numbers-sizes), n_all, c)
+    for i, block in zip(m_block, split(roots, (numbers-sizes).cumsum()[:-1])):
+        chains[(mode, i)] = block if (mode, i) not in chains else concatenate((chains[(mode, i)], block))
+    if instrumentation.ENABLED:
+        instrumentation.count('enumeration roots solved', roots.size)
+    return chains[(mode, m)][n-1]
+
+@timed('propagating_modes')
+def propagating_modes(c, k, modes=('TE', 'TM'), max_modes=None):
+    ''' the TE / TM modes with chi_mn < k (those that propagate at wavenumber
+        k in the guide) as a list of (mode, m, n, chi) in order of chi (cutoff).
+        For m > 0 each is a degenerate pair (cos(m phi) and sin(m phi)).
+        
+        Walks outwards from the lowest mode with a priority queue, using that
+        chi_mn grows with n, and chi_m1 with m (for TE from m=1, TE0n being its 
+        own chain), so the walk can stop at the first root above k (or after 
+        max_modes modes), and the roots are solved a few at a time as the walk
+        reaches them.
+        At optical wavelengths (e.g. the default LAMBDA with an inner radius of 
+        1 m) there are far too many modes to list, so unless max_modes is given
+        this raises a ValueError if more than about MAX_MODES modes propagate '''
+    c, k = float(c), float(k)
+    if max_modes is None:
+        # (Weyl's law, there are about (c^2-1) k^2/8 modes of each type)
+        estimate = len(modes)*(c**2-1)*k**2/8.
+        if estimate > MAX_MODES:
+            raise ValueError('about %.3g modes propagate, give max_modes to list '
+                             'only the lowest ones' % estimate)
+    chains = {}     # (mode, m) -> roots chi_m1, chi_m2, ... solved so far
+    queue = []      # (chi, mode, m, n) of the next mode of each chain
+    
+    def push(mode, m, n):
+        chi = solve_chain(mode, m, n, c, k, chains)
+        if isfinite(chi):
+            heappush(queue, (chi, mode, m, n))
+    
+    for mode in modes:
+        if mode not in ROOT_EQUATIONS:
+            raise ValueError('mode must be one of %s' % sorted(ROOT_EQUATIONS))
+        # TM from m=0, TE from m=1 with the TE0n on their own
+        for m in {'TM': [0], 'TE': [1, 0]}[mode]:
+            push(mode, m, 1)
+    
+    found = []
+    while queue and (max_modes is None or len(found) < max_modes):
+        chi, mode, m, n = heappop(queue)
+        if chi >= k: break
+        found.append((mode, m, n, float(chi)))
+        push(mode, m, n+1)
+        if n == 1 and not (mode == 'TE' and m == 0):
+            push(mode, m+1, 1)
+    return found
+
+
+def field_array(shape, out=None):
+    ''' array of shape (len(FIELD_COMPONENTS),)+shape to hold evaluated fields.
+        If out is given, check it's the right shape and use it instead '''
+    shape = (len(FIELD_COMPONENTS),) + tuple(shape)
+    if out is None:
+        return empty(shape)
+    if out.shape != shape:
+        raise ValueError('out must have shape %s, not %s' % (shape, out.shape))
+    return out
+
+def cartesian_fields(phi, out):
+    ''' fill the E_x, E_y, H_x, H_y slots of a field array (out) from its 
+        polar components, using 
+        x = rho_hat*cos(phi) - phi_hat*sin(phi)
+        y = rho_hat*sin(phi) + phi_hat*cos(phi) '''
+    E_rho, E_phi, E_z, H_rho, H_phi, H_z, E_x, E_y, H_x, H_y = out
+    cos_phi, sin_phi = cos(phi), sin(phi)
+    temp = empty(out.shape[1:])
+    for (f_rho, f_phi, f_x, f_y) in [(E_rho, E_phi, E_x, E_y), 
+                                     (H_rho, H_phi, H_x, H_y)]:
+        multiply(f_rho, cos_phi, out=f_x)
+        f_x -= multiply(f_phi, sin_phi, out=temp)
+        multiply(f_rho, sin_phi, out=f_y)
+        f_y += multiply(f_phi, cos_phi, out=temp)
+    return out
+
+# most grid points evaluated at once by field_map (the memory used is about
+# 15 arrays of this many floats)
+TILE_POINTS = 2**18
+
+def field_map(mode, rho, phi, out=None, tile_points=TILE_POINTS):
+    ''' Every field component of mode on the grid of 1d arrays rho x phi, 
+        in an array of shape (len(FIELD_COMPONENTS), len(phi), len(rho)) (i.e.
+        on meshgrid(rho, phi)). The grid is evaluated a tile of at most 
+        tile_points points at a time into a reused buffer, and copied into out,
+        so out can be a memory-mapped file far bigger than memory '''
+    rho, phi = asarray(rho, dtype=float), asarray(phi, dtype=float)
+    out = field_array((phi.size, rho.size), out)
+    
+    # tiles of whole rows where possible
+    cols = min(rho.size, tile_points)
+    rows = max(1, min(phi.size, tile_points//cols))
+    buffer = empty((len(FIELD_COMPONENTS), rows, cols))
+    for i in range(0, phi.size, rows):
+        phi_tile = phi[i:i+rows, None]
+        for j in range(0, rho.size, cols):
+            rho_tile = rho[None, j:j+cols]
+            tile = buffer[:, :phi_tile.size, :rho_tile.size]
+            mode.fields(rho_tile, phi_tile, out=tile)
+            out[:, i:i+rows, j:j+cols] = tile
+    return out
+
+
+# Chebyshev approximations of Z(x) and Z'(x) (see TMmode.use_interpolant)
+# are fitted to this accuracy (relative to the largest value of each) ...
+INTERPOLANT_TOLERANCE = 1e-10
+# ... with at most this degree, and checked against the Bessel functions at
+# this many random points
+MAX_INTERPOLANT_DEGREE = 1024
+VALIDATION_POINTS = 1000
+
+class RadialInterpolant:
+    ''' Chebyshev series for Z(x) and Z'(x) of a mode over x = chi*rho for the
+        whole waveguide, chi <= x <= c*chi. Much cheaper to evaluate at many 
+        points than the Bessel functions, and checked against them when made '''
+    
+    def __init__(self, mode, tol=INTERPOLANT_TOLERANCE, max_degree=MAX_INTERPOLANT_DEGREE):
+        self.root = mode.root
+        self.domain = (mode.root, mode.c*mode.root)
+        self.tol = tol
+        exact = lambda x: mode.bessel_z_and_z_dash(asarray(x, dtype=float))
+        
+        # double the degree until the series has converged
+        degree = 16
+        while True:
+            self.z = Chebyshev.interpolate(lambda x: exact(x)[0], degree, self.domain)
+            self.z_dash = Chebyshev.interpolate(lambda x: exact(x)[1], degree, self.domain)
+            tail = max(abs(self.z.coef[-3:]).max()/abs(self.z.coef).max(),
+                       abs(self.z_dash.coef[-3:]).max()/abs(self.z_dash.coef).max())
+            if tail < tol/10. or degree >= max_degree: break
+            degree *= 2
+        self.degree = degree
+        
+        # compare with the Bessel functions at random points (and the ends)
+        x = RandomState(0).uniform(self.domain[0], self.domain[1], VALIDATION_POINTS)
+        x = concatenate((self.domain, x))
+        z, z_dash = exact(x)
+        self.error = max(abs(self.z(x) - z).max()/abs(z).max(),
+                         abs(self.z_dash(x) - z_dash).max()/abs(z_dash).max())
+        if not self.error <= tol:
+            raise ValueError('Chebyshev series of degree %d only accurate to %.2g, not %.2g'
+                             % (degree, self.error, tol))
+    
+    def covers(self, x):
+        ''' True if every x is in the interval the series was fitted over '''
+        lo, hi = self.domain
+        slack = 1e-12*hi
+        return x.size == 0 or (x.min() >= lo-slack and x.max() <= hi+slack)
+    
+    def __call__(self, x, out=None):
+        ''' Z(x) and Z'(x), out = optional pair of arrays to put them in '''
+        if out is None:
+            return self.z(x), self.z_dash(x)
+        out[0][...] = self.z(x)
+        out[1][...] = self.z_dash(x)
+        return out
+
+
+class FieldPlot:
+    ''' Plotting of the field arrows of a mode in a polar axis, for anything
+        with a c (ratio of outer to inner radius), field_arrows and 
+        get_field_plot_title, and the E_field, H_field, field_ax and 
+        field_grid attributes (all None to start with) '''
+    
+    def setup_field_axis(self, ax=None, axis_bgcolor='white', fig_facecolor='gray'):
+        ''' make a polar axis (in ax's figure, which is cleared, or a new figure) 
+            with the annulus of the waveguide drawn in it, ready to plot fields in '''
+        import matplotlib.pyplot as plt
+        
+        # if no axis is given, make a new plot
+        if ax is None:
+            fig = plt.figure()
+        else:
+            ''' if a figure is already given need to clear it and make sure it's polar projection '''
+            fig = ax.figure
+            fig.clear()
+        
+        fig.set_facecolor(fig_facecolor)    
+        ax = fig.add_subplot(111, projection='polar', 
+                             axis_bgcolor=axis_bgcolor)
+                        
+        b = 1           # inner radius   
+        a = b*self.c    # outer radius
+        
+        # plot the centre circle of the annulus
+        circle_N = 100
+        circle_phi = linspace(0,2*pi,circle_N)
+        circle_inner_radius = circle_N*[b]
+        circle_outer_radius = circle_N*[a]
+        circle_centre = circle_N*[0]
+        ax.fill_between(circle_phi, circle_centre, circle_inner_radius,
+                        facecolor=fig_facecolor, alpha=1.0, linewidth=0)
+        ax.plot(circle_phi, circle_inner_radius, 
+                circle_phi, circle_outer_radius,
+                linewidth=2, color='black')
+        
+        # get rid of the radial and polar ticks
+        ax.set_thetagrids([]), ax.set_rticks([])
+        
+        # there's no field plotted in this axis yet
+        self.field_ax = ax
+        self.E_field = self.H_field = None
+        self.field_grid = None
+        return ax
+   
+    @timed('plot_field')
+    def plot_field(self, ax, 
+                   E_color='blue', H_color='orange', 
+                   axis_bgcolor='white', fig_facecolor='gray',
+                   n_rho=15, n_phi=60, values=None):
+        ''' plots H field into ax (matplotlib.Axes class) 
+            n_rho = number of different rho(radial) points to use
+            n_phi = number of different phi(polar angle) points to use
+            values = field_arrows(n_rho, n_phi) if it's already been calculated
+            If ax is the polar axis this mode last plotted in (self.field_ax),
+            the axis and annulus are kept and only the arrows are updated '''
+        
+        # set up a new polar axis unless we already have one in this figure
+        if ax is None or ax is not self.field_ax or ax not in ax.figure.axes:
+            ax = self.setup_field_axis(ax, axis_bgcolor, fig_facecolor)
+        ax.set_title(self.get_field_plot_title())
+        
+        # vector field in Cartesian x,y basis, calculated from rho, phi basis
+        if values is None:
+            values = self.field_arrows(n_rho, n_phi)
+        RHO, PHI, F = values
+        E_rho, E_phi, E_z, H_rho, H_phi, H_z, E_x, E_y, H_x, H_y = F
+        
+        if self.field_grid == (n_rho, n_phi):
+            # same arrow positions, just change their directions / lengths
+            for quiver, U, V in [(self.E_field, E_x, E_y), (self.H_field, H_x, H_y)]:
+                # let the arrow length scale be recalculated for the new field
+                quiver.scale = None
+                quiver.set_UVC(U, V)
+        else:
+            # a quiver can't change its number of arrows, so replace them
+            # (keeping them shown / hidden as they were)
+            visible = [True, True]
+            for i, quiver in enumerate([self.E_field, self.H_field]):
+                if quiver is not None:
+                    visible[i] = quiver.get_visible()
+                    quiver.remove()
+            # make the field plots
+            self.E_field = ax.quiver(PHI,RHO,E_x,E_y, color=E_color)
+            self.H_field = ax.quiver(PHI,RHO,H_x,H_y, color=H_color)
+            self.E_field.set_visible(visible[0])
+            self.H_field.set_visible(visible[1])
+            self.field_grid = (n_rho, n_phi)
+
+
+class TMmode(FieldPlot):
     '''Contain a single TM wave guide mode, and methods to calculate important 
        quantities'''
     
-    def __init__(self,m,n,c):
+    def __init__(self,m,n,c, wavelength=LAMBDA, epsilon=EPSILON, mu=MU):
         # make sure values are valid
         if m<0:
             raise NotGreaterThenZero, 'm must be non-negative'
@@ -50,36 +838,159 @@ class TMmode:
         self.c = c      # Ratio of outer to inner radius 
         self.root = 0   # root of equation
         self.kz = 0     # z component of the wavenumber k
+        self.set_medium(wavelength, epsilon, mu, update=False)
+        # root dependent coefficients of Z(x), and the root they were found for
+        self.coefficients = None
+        self.coefficients_root = None
+        # optional polynomial approximation of Z(x), Z'(x) (see use_interpolant)
+        self.interpolant_tol = None
+        self.interpolant = None
+        self.interpolant_failed = None  # (root, tol) of a fit that wasn't accurate enough
         self.set_root() # sets initial root to something reasonable
         self.drag = None    # information to drag root in plot
+        self.root_samples = None    # cached samples of the root equation
         
         self.E_field = None # The quiver / arrow plot of the Electric field
         self.H_field = None # "                            " Magnetic field
+        self.field_ax = None    # the polar axis the fields were plotted in
+        self.field_grid = None  # (n_rho, n_phi) of the plotted arrows
                         
     def __str__(self):
         return "<%s mode>  m = %s, n = %s, c = %s" % (self.mode, self.m, self.n, self.c)
     
     def root_equation(self,m,c,x):
         'Radial root equation of Phi for TM mode'
-        return yn(m,x)*jn(m,c*x)-jn(m,x)*yn(m,c*x)
+        return tm_root_equation(m,c,x)
+    
+    def root_coefficients(self, m, chi):
+        ''' (A, B) in Z(x) = A*J_m(x) - B*Y_m(x) for TM mode '''
+        return yn(m,chi), jn(m,chi)
+    
+    def bessel_coefficients(self):
+        ''' (A, B) in Z(x) = A*J_m(x) - B*Y_m(x). These only depend on the root,
+            so are only recalculated when the root changes '''
+        # (read the root once, so the coefficients are stored under the root
+        # they were worked out for)
+        root = self.root
+        if self.coefficients_root is None or any(self.coefficients_root != root):
+            coefficients = self.root_coefficients(self.m, root)
+            self.coefficients, self.coefficients_root = coefficients, root
+            return coefficients
+        return self.coefficients
     
     def z(self,x):
         'Z(x) equation that keeps showing up in waveguide modes'
-        m, n, chi = self.m, self.n, self.root
-        return yn(m,chi)*jn(m,x)-jn(m,chi)*yn(m,x)
+        A, B = self.bessel_coefficients()
+        return A*jn(self.m,x)-B*yn(self.m,x)
     
     def z_dash(self,x):
         ''' Z'(x) equation for waveguide mode '''
-        m, n, chi = self.m, self.n, self.root
+        A, B = self.bessel_coefficients()
         # jvp(m,x,r) is the rth derivative of the bessel function of order m evaluated at x
-        return yn(m,chi)*jvp(m,x,1)-jn(m,chi)*yvp(m,x,1)
+        return A*jvp(self.m,x,1)-B*yvp(self.m,x,1)
+    
+    def use_interpolant(self, tol=INTERPOLANT_TOLERANCE):
+        ''' evaluate Z(x) and Z'(x) in the waveguide (chi <= x <= c*chi) from
+            Chebyshev series accurate to tol, rather than Bessel functions. 
+            The series are refitted whenever the root changes. tol=None goes
+            back to the Bessel functions. Returns the RadialInterpolant, or 
+            None if the series couldn't be made accurate enough '''
+        self.interpolant_tol = tol
+        self.interpolant = None
+        self.interpolant_failed = None
+        return self.radial_interpolant()
+    
+    def radial_interpolant(self):
+        ''' the RadialInterpolant for the current root (fitted if needed),
+            or None if there isn't one '''
+        root, tol = self.root, self.interpolant_tol
+        if tol is None or self.interpolant_failed == (root, tol):
+            return None
+        fitted = self.interpolant
+        if fitted is None or fitted.root != root or fitted.tol != tol:
+            try:
+                fitted = RadialInterpolant(self, tol)
+            except ValueError:
+                # (remember the failure, so the fit isn't retried for this root)
+                self.interpolant = None
+                self.interpolant_failed = (root, tol)
+                return None
+            self.interpolant = fitted
+        return fitted
+    
+    def z_and_z_dash(self, x, out=None):
+        ''' Z(x) and Z'(x) together, from the Chebyshev series if use_interpolant
+            has been called (and x is in the waveguide), otherwise from the 
+            Bessel functions (see bessel_z_and_z_dash).
+            out = optional pair of arrays to put Z and Z' in '''
+        interpolant = self.radial_interpolant()
+        if interpolant is not None and interpolant.covers(x):
+            return interpolant(x, out)
+        return self.bessel_z_and_z_dash(x, out)
+    
+    def bessel_z_and_z_dash(self, x, out=None):
+        ''' Z(x) and Z'(x) together, sharing the Bessel function evaluations
+            by using J'_m(x) = J_m-1(x) - m/x*J_m(x) (and likewise for Y'_m).
+            out = optional pair of arrays to put Z and Z' in '''
+        m = self.m
+        A, B = self.bessel_coefficients()
+        z, z_dash = (empty(x.shape), empty(x.shape)) if out is None else out
+        
+        J, Y = jn(m,x), yn(m,x)
+        multiply(J, A, out=z)
+        z -= multiply(Y, B, out=Y)
+        # Z'(x) = A*J_m-1(x) - B*Y_m-1(x) - m/x*Z(x)
+        jn(m-1, x, out=J)
+        yn(m-1, x, out=Y)
+        multiply(J, A, out=z_dash)
+        z_dash -= multiply(Y, B, out=Y)
+        z_dash -= multiply(divide(z, x, out=J), m, out=J)
+        return z, z_dash
+    
+    def set_medium(self, wavelength=None, epsilon=None, mu=None, update=True):
+        ''' set the (free space) wavelength of the light, and the permittivity
+            and permeability of the medium filling the guide (those not given
+            are left as they are) '''
+        if wavelength is not None:
+            self.wavelength = wavelength
+        if epsilon is not None:
+            self.epsilon = epsilon
+        if mu is not None:
+            self.mu = mu
+        self.omega = 2*pi*C/self.wavelength         # angular frequency
+        self.k = wavenumber(self.omega, self.epsilon, self.mu)
+        if update:
+            self.update_kz()
     
     def update_kz(self):
         ''' wave number (2 pi lambda)^-1 in z direction '''
         # In plots we will take inner radius (b) to be 1
         # kz^2 = k^2-(chi/b)^2 = k^2-chi^2
         chi = self.root
-        self.kz = sqrt(K**2 - chi**2)
+        self.kz = sqrt(self.k**2 - chi**2)
+    
+    def cutoff_frequency(self):
+        ''' angular frequency below which the mode doesn't propagate '''
+        return cutoff_frequency(self.root, self.epsilon, self.mu)
+    
+    def cutoff_wavelength(self):
+        ''' (free space) wavelength above which the mode doesn't propagate '''
+        return cutoff_wavelength(self.root, self.epsilon, self.mu)
+    
+    def is_propagating(self):
+        ''' does the mode propagate at its wavelength (rather than being evanescent) '''
+        return self.k > self.root
+    
+    def dispersion(self, omega):
+        ''' (kz, group velocity, propagating) at an array of angular frequencies,
+            see the dispersion function '''
+        return dispersion(self.root, asarray(omega, dtype=float), self.epsilon, self.mu)
+    
+    def propagating_modes(self, max_modes=None):
+        ''' the TE / TM modes (mode, m, n, chi) that propagate in this guide at
+            this mode's wavelength and medium, in order of cutoff (give 
+            max_modes at optical wavelengths, see propagating_modes) '''
+        return propagating_modes(self.c, self.k, max_modes=max_modes)
     
     def E_rho(self, rho, phi):
         ''' radial component of electric field evaluated at (rho,phi) - polar coordinates '''
@@ -99,12 +1010,12 @@ class TMmode:
     def H_rho(self, rho, phi):
         ''' radial component of magnetic field '''
         m, chi = self.m, self.root
-        return -1*OMEGA*EPSILON*m/rho*self.z(chi*rho)*sin(m*phi)
+        return -1*self.omega*self.epsilon*m/rho*self.z(chi*rho)*sin(m*phi)
     
     def H_phi(self, rho, phi):
         ''' polar component of magnetic field '''
         m, chi = self.m, self.root
-        return -1*OMEGA*EPSILON*chi*self.z_dash(chi*rho)*cos(m*phi)
+        return -1*self.omega*self.epsilon*chi*self.z_dash(chi*rho)*cos(m*phi)
     
     def H_z(self, rho, phi):
         ''' z component of magnetic field '''
@@ -112,10 +1023,58 @@ class TMmode:
         # rho and phi are meshgrid arrays
         
         return zeros(rho.shape)
+    
+    def fields(self, rho, phi, out=None):
+        ''' Every field component at (rho,phi) in one array, ordered as in 
+            FIELD_COMPONENTS, i.e. unpack with
+            E_rho, E_phi, E_z, H_rho, H_phi, H_z, E_x, E_y, H_x, H_y = mode.fields(rho, phi)
+            The Bessel functions and cos / sin are only evaluated once, and the 
+            components are written straight into out if it's given (an array of
+            shape (len(FIELD_COMPONENTS),)+shape of rho and phi broadcast together).
+            The Bessel functions are only evaluated over rho's own shape, so for
+            a grid pass a row of rho values and a column of phi values, e.g.
+            fields(rho[None,:], phi[:,None]), rather than meshgrid arrays '''
+        rho, phi = asarray(rho, dtype=float), asarray(phi, dtype=float)
+        shape = broadcast(rho, phi).shape
+        if len(shape) == 0:
+            # a single point, work on 1 element arrays so out[i] is still an array
+            return self.fields(rho.reshape(1), phi.reshape(1))[:,0]
+        if rho.ndim == 0:
+            rho = rho.reshape(1)
+        out = field_array(shape, out)
+        self.polar_fields(rho, phi, out)
+        return cartesian_fields(phi, out)
+    
+    def polar_fields(self, rho, phi, out):
+        ''' fill the six polar components of a field array (out). Every 
+            component is a radial part times cos(m*phi) or sin(m*phi), so the
+            Bessel functions are evaluated on rho and the angular parts on phi
+            (each on their own shape) and only combined at the end '''
+        m, chi = self.m, self.root
+        z, z_dash = self.z_and_z_dash(chi*rho)
+        self.combine_fields(rho, z, z_dash, cos(m*phi), sin(m*phi), out)
+        
+    def combine_fields(self, rho, z, z_dash, cos_m, sin_m, out):
+        ''' polar TM field components from Z(chi*rho), Z'(chi*rho), cos(m*phi) and sin(m*phi).
+            The radial profiles (constants included) are worked out first, so
+            each component is a single broadcast multiply '''
+        m, chi, kz = self.m, self.root, self.kz
+        E_rho, E_phi, E_z, H_rho, H_phi, H_z = out[:6]
+        dz = chi*z_dash     # chi*Z'(chi*rho)
+        mz = m*z/rho        # m/rho*Z(chi*rho)
+        # E_rho and H_phi go as Z'(chi*rho)*cos(m*phi)
+        multiply(-1*kz*dz, cos_m, out=E_rho)
+        multiply(-1*self.omega*self.epsilon*dz, cos_m, out=H_phi)
+        # E_phi and H_rho go as m/rho*Z(chi*rho)*sin(m*phi)
+        multiply(kz*mz, sin_m, out=E_phi)
+        multiply(-1*self.omega*self.epsilon*mz, sin_m, out=H_rho)
+        
+        multiply(chi**2*z, cos_m, out=E_z)
+        H_z[...] = 0
         
     def guess_root(self,m,n,c):
         'Guess the root chi_mn for TM mode'
-        return pi*n/(c-1.)
+        return float(tm_guess_root(m,n,c))
     
     def set_root(self, guess=None):
         'Set the initial guess value for the root'
@@ -128,17 +1087,33 @@ class TMmode:
         # update the kz now that we have a new root
         self.update_kz()
                     
-    def find_root(self):
-        'find root using Newton method'
-        f = lambda x: self.root_equation(self.m,self.c,x)
-        try:
-            self.root = newton(f, self.root, maxiter=100)
-        except RuntimeError:
-            pass
+    @timed('find_root')
+    def find_root(self, near=None):
+        ''' find the nth root of the radial root equation by counting sign 
+            changes, then polishing with a bracketed Newton method.
+            If near is given, find the root closest to x=near instead, and 
+            update n to be the index of that root '''
+        m, c = self.m, self.c
+        if near is None and ROOT_CACHE is not None:
+            root = ROOT_CACHE.get(self.mode, m, self.n, c)
+        elif near is None:
+            root = find_roots(self.mode, m, self.n, c)
+        else:
+            # the dragged root may be a 1 element array
+            self.n, root = find_root_near(self.mode, m, c, asarray(near).item())
+        
+        if isfinite(root):
+            self.root = float(root)
         
         # update the kz
         self.update_kz()
             
+    def trace_root(self, c_end, step=None, max_step=None, check_every=20):
+        ''' follow this mode's root chi_mn as c goes from self.c to c_end, 
+            returns the curve as arrays (c, chi) (see trace_root function) '''
+        return trace_root(self.mode, self.m, self.n, self.c, c_end, 
+                          step=step, max_step=max_step, check_every=check_every)
+            
     def marcuvitz(self):
         'returns a string label and value for the root form tabulated in Marcuvitz'
         label = '(c-1)*chi'
@@ -147,6 +1122,8 @@ class TMmode:
     
     def plot_root(self, ax=None, color='red', size=8):
         'plot calculated root'
+        import matplotlib.pyplot as plt
+        from interactive_plot import DragRoot
         # convenient variables
         m, n, c, root = self.m, self.n, self.c, self.root
         
@@ -173,7 +1150,12 @@ class TMmode:
         
         new_guess = self.drag.get_xdata()
         self.set_root(guess=new_guess)
-        self.find_root()
+        self.find_root(near=self.root)
+        self.show_root()
+    
+    def show_root(self):
+        ''' move the draggable root in the root plot to the current root '''
+        if self.drag is None: return
         
         # set new xdata in the plot
         new_x = self.root
@@ -184,8 +1166,11 @@ class TMmode:
         # draw on this figure now
         self.drag.draw()
         
+    @timed('plot_root_equation')
     def plot_root_equation(self, ax=None, Npoints=400):
         ''' Plot the radial root equation '''
+        import matplotlib.pyplot as plt
+        from root_zoom_plot import RootZoomPlot
         
         # if no axis is given, make a new plot
         if ax is None:
@@ -196,7 +1181,10 @@ class TMmode:
         ax.axhline(0,0, linewidth=1, linestyle='dashed', color='black')
     
         # set up root function plot to have zoom function
-        f = lambda x: self.root_equation(self.m, self.c, x)
+        # (the samples are cached, so zooming only evaluates the new points)
+        if self.root_samples is None:
+            self.root_samples = SampleCache(lambda x: self.root_equation(self.m, self.c, x))
+        f = self.root_samples
         self.rootplot = RootZoomPlot(f, axis=ax, Npoints=Npoints, 
                         x_min=0, x_max=2*self.root)
         # set the title for the new plot
@@ -209,27 +1197,11 @@ class TMmode:
         ''' the title given to the vector field plot '''
         return '%s %i,%i mode'%(self.mode, self.m, self.n) 
    
-    def plot_field(self, ax, 
-                   E_color='blue', H_color='orange', 
-                   axis_bgcolor='white', fig_facecolor='gray',
-                   n_rho=15, n_phi=60):
-        ''' plots H field into ax (matplotlib.Axes class) 
-            n_rho = number of different rho(radial) points to use
-            n_phi = number of different phi(polar angle) points to use'''
-        
-        # if no axis is given, make a new plot
-        if ax is None:
-            fig = plt.figure()
-        else:
-            ''' if a figure is already given need to clear it and make sure it's polar projection '''
-            fig = ax.figure
-            fig.clear()
-        
-        fig.set_facecolor(fig_facecolor)    
-        ax = fig.add_subplot(111, projection='polar', 
-                             axis_bgcolor=axis_bgcolor)
-        ax.set_title(self.get_field_plot_title())
-                        
+    @timed('field_arrows')
+    def field_arrows(self, n_rho=15, n_phi=60):
+        ''' (RHO, PHI, fields) on a n_rho x n_phi meshgrid over the annulus, 
+            the points and values plot_field draws arrows at. This doesn't 
+            touch any plots, so it can be run in a background thread '''
         b = 1           # inner radius   
         a = b*self.c    # outer radius
         
@@ -237,60 +1209,27 @@ class TMmode:
         phi = linspace(0,2*pi,n_phi)
         # meshgrid form of rho and phi
         RHO, PHI = meshgrid(rho, phi)
-        
-        # plot the centre circle of the annulus
-        circle_N = 100
-        circle_phi = linspace(0,2*pi,circle_N)
-        circle_inner_radius = circle_N*[b]
-        circle_outer_radius = circle_N*[a]
-        circle_centre = circle_N*[0]
-        ax.fill_between(circle_phi, circle_centre, circle_inner_radius,
-                        facecolor=fig_facecolor, alpha=1.0, linewidth=0)
-        ax.plot(circle_phi, circle_inner_radius, 
-                circle_phi, circle_outer_radius,
-                linewidth=2, color='black')
-        
-        # Vector field in rho, phi basis
-        H_rho = self.H_rho
-        H_phi = self.H_phi
-        E_rho = self.E_rho
-        E_phi = self.E_phi
-
-        # vector field in Cartesian x,y basis, calculated from rho, phi basis
-        E_x = E_rho(RHO,PHI)*cos(PHI)-E_phi(RHO,PHI)*sin(PHI)
-        E_y = E_rho(RHO,PHI)*sin(PHI)+E_phi(RHO,PHI)*cos(PHI)
-        H_x = H_rho(RHO,PHI)*cos(PHI)-H_phi(RHO,PHI)*sin(PHI)
-        H_y = H_rho(RHO,PHI)*sin(PHI)+H_phi(RHO,PHI)*cos(PHI)
-        # make the field plots
-        self.E_field = ax.quiver(PHI,RHO,E_x,E_y, color=E_color)
-        self.H_field = ax.quiver(PHI,RHO,H_x,H_y, color=H_color)
-        
-
-        # get rid of the radial and polar ticks
-        ax.set_thetagrids([]), ax.set_rticks([])
-
+        if instrumentation.ENABLED:
+            instrumentation.count('field points', RHO.size)
+        # the same grid, as a row of rho and a column of phi
+        return RHO, PHI, self.fields(rho[None,:], phi[:,None])
         
 class TEmode(TMmode, object):
     '''Contain a single TE wave guide mode, and methods to calculate important 
         quantities'''
     
-    def __init__(self,m,n,c):
+    def __init__(self,m,n,c, wavelength=LAMBDA, epsilon=EPSILON, mu=MU):
         # Initialize the super class
-        super(TEmode, self).__init__(m,n,c)
+        super(TEmode, self).__init__(m,n,c, wavelength, epsilon, mu)
         self.mode = 'TE'
     
     def root_equation(self,m,c,x):
         '''Radial root equation of Phi for TE mode'''
-        return yvp(m,x,1)*jvp(m,c*x,1)-jvp(m,x,1)*yvp(m,c*x,1)
+        return te_root_equation(m,c,x)
     
     def guess_root(self,m,n,c):
         '''Guess the root chi_mn for TE mode'''
-        if m==0:
-            return pi*n/(c-1.)
-        elif m!=0 and n==1:
-            return 2*m/(c+1.)
-        else:
-            return pi*(n-1.)/(c-1.)
+        return float(te_guess_root(m,n,c))
             
     def marcuvitz(self):
         '''returns a string label and value for the root form tabulated in Marcuvitz'''
@@ -302,26 +1241,19 @@ class TEmode(TMmode, object):
             root = (self.c-1.)*self.root
         return label, root
     
-    def z(self,x):
-        'Z(x) equation that keeps showing up in waveguide modes'
-        m, n, chi = self.m, self.n, self.root
-        return yvp(m,chi,1)*jn(m,x)-jvp(m,chi,1)*yn(m,x)
-    
-    def z_dash(self,x):
-        ''' Z'(x) equation for waveguide mode '''
-        m, n, chi = self.m, self.n, self.root
-        # jvp(m,x,r) is the rth derivative of the bessel function of order m evaluated at x
-        return yvp(m,chi,1)*jvp(m,x,1)-jvp(m,chi,1)*yvp(m,x,1)
+    def root_coefficients(self, m, chi):
+        ''' (A, B) in Z(x) = A*J_m(x) - B*Y_m(x) for TE mode '''
+        return yvp(m,chi,1), jvp(m,chi,1)
     
     def E_rho(self, rho, phi):
         ''' radial component of electric field evaluated at (rho,phi) - polar coordinates '''
         m, chi, kz = self.m, self.root, self.kz
-        return OMEGA*MU*m/rho*self.z(chi*rho)*sin(m*phi)
+        return self.omega*self.mu*m/rho*self.z(chi*rho)*sin(m*phi)
     
     def E_phi(self, rho, phi):
         ''' polar component of electric field evaluated at (rho,phi) - polar coordinates '''
         m, chi, kz = self.m, self.root, self.kz
-        return OMEGA*MU*chi*self.z_dash(chi*rho)*cos(m*phi)
+        return self.omega*self.mu*chi*self.z_dash(chi*rho)*cos(m*phi)
     
     def E_z(self, rho, phi):
         ''' z component of Electric field '''
@@ -342,14 +1274,36 @@ class TEmode(TMmode, object):
         m, chi, kz = self.m, self.root, self.kz
         return chi**2*self.z(chi*rho)*cos(m*phi)
     
+    def combine_fields(self, rho, z, z_dash, cos_m, sin_m, out):
+        ''' polar TE field components from Z(chi*rho), Z'(chi*rho), cos(m*phi) and sin(m*phi) '''
+        m, chi, kz = self.m, self.root, self.kz
+        E_rho, E_phi, E_z, H_rho, H_phi, H_z = out[:6]
+        dz = chi*z_dash     # chi*Z'(chi*rho)
+        mz = m*z/rho        # m/rho*Z(chi*rho)
+        # E_phi and H_rho go as Z'(chi*rho)*cos(m*phi)
+        multiply(self.omega*self.mu*dz, cos_m, out=E_phi)
+        multiply(-1*kz*dz, cos_m, out=H_rho)
+        # E_rho and H_phi go as m/rho*Z(chi*rho)*sin(m*phi)
+        multiply(self.omega*self.mu*mz, sin_m, out=E_rho)
+        multiply(kz*mz, sin_m, out=H_phi)
+        
+        multiply(chi**2*z, cos_m, out=H_z)
+        E_z[...] = 0
+    
 class TEMmode(TMmode, object):
     ''' contain a single TEM mode information and methods to calculate important
         quantities '''
     
-    def __init__(self,c):
+    def __init__(self,c, wavelength=LAMBDA, epsilon=EPSILON, mu=MU):
         self.c = c
         self.mode = 'TEM'
         self.field_plot_title = '%s mode'%self.mode
+        self.set_medium(wavelength, epsilon, mu)
+        
+        self.E_field = None # The quiver / arrow plot of the Electric field
+        self.H_field = None # "                            " Magnetic field
+        self.field_ax = None    # the polar axis the fields were plotted in
+        self.field_grid = None  # (n_rho, n_phi) of the plotted arrows
     
     def __str__(self): 
         return '%s mode, c=%s'%(self.mode, self.c)
@@ -357,32 +1311,62 @@ class TEMmode(TMmode, object):
     def get_field_plot_title(self):
         ''' title to be used when plotting the vector fields '''
         return '%s mode' % self.mode
+    
+    def update_kz(self):
+        ''' TEM modes have no cutoff, kz = k '''
+        self.kz = self.k
+    
+    def cutoff_frequency(self):
+        ''' TEM modes propagate at every frequency '''
+        return 0.
+    
+    def cutoff_wavelength(self):
+        ''' TEM modes propagate at every wavelength '''
+        return float('inf')
+    
+    def is_propagating(self):
+        ''' TEM modes always propagate '''
+        return True
+    
+    def dispersion(self, omega):
+        ''' (kz, group velocity, propagating) at an array of angular frequencies,
+            kz = k and the group velocity is the speed of light in the medium '''
+        return dispersion(0., asarray(omega, dtype=float), self.epsilon, self.mu)
+    
     def E_rho(self, rho, phi):
         ''' radial component of electric field '''
-        return -1*K/rho
+        return -1*self.k/rho
     
     def E_phi(self, rho, phi):
         ''' polar component of Electric field '''
-        return 0
+        return zeros(broadcast(rho, phi).shape)
     
     def E_z(self, rho, phi):
         ''' z component of electric field '''
-        return 0
+        return zeros(broadcast(rho, phi).shape)
     
     def H_rho(self, rho, phi):
         ''' radial component of magnetic field '''
-        return 0
+        return zeros(broadcast(rho, phi).shape)
     
     def H_phi(self, rho, phi):
         ''' polar component of magnetic field '''
-        return -OMEGA*EPSILON/rho
+        return -self.omega*self.epsilon/rho
     
     def H_z(self, rho, phi):
         ''' z component of magnetic field '''
-        return 0
+        return zeros(broadcast(rho, phi).shape)
+    
+    def polar_fields(self, rho, phi, out):
+        ''' fill the six polar components of a field array (out) '''
+        E_rho, E_phi, E_z, H_rho, H_phi, H_z = out[:6]
+        divide(-1*self.k, rho, out=E_rho)
+        divide(-self.omega*self.epsilon, rho, out=H_phi)
+        E_phi[...], E_z[...], H_rho[...], H_z[...] = 0, 0, 0, 0
     
     
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     
     # set parameters
     Nx = 200 # number of x values to plot
@@ -0,0 +1,96 @@
+''' Opt-in timings and counters, to see where the time goes (Newton iterations,
+    Bessel function evaluations, building quivers, drawing the canvas ...).
+
+    Turned on by setting the environment variable WAVEGUIDE_PROFILE before
+    starting, either to 1, or to a .json filename the stats are written to
+    when the viewer closes, e.g.
+        WAVEGUIDE_PROFILE=stats.json python waveguide_viewer.py
+
+    When it's off, timed() hands back functions undecorated and counters are
+    only touched behind "if ENABLED", so it costs nothing '''
+
+import os
+import json
+import threading
+from functools import wraps
+from timeit import default_timer
+
+_setting = os.environ.get('WAVEGUIDE_PROFILE', '')
+ENABLED = _setting not in ('', '0')
+# where to write the stats when the viewer closes (if anywhere)
+DUMP_FILENAME = _setting if _setting.endswith('.json') else None
+
+# name -> [number of calls, total time, longest time] (seconds)
+TIMINGS = {}
+# name -> running total
+COUNTERS = {}
+
+# calls can come from the background worker thread as well as the GUI thread
+_lock = threading.Lock()
+
+
+def record_time(name, seconds):
+    ''' add a call that took seconds to the timings of name '''
+    with _lock:
+        timing = TIMINGS.setdefault(name, [0, 0., 0.])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+def count(name, amount=1):
+    ''' add amount to the counter name (call as "if ENABLED: count(...)") '''
+    with _lock:
+        COUNTERS[name] = COUNTERS.get(name, 0) + amount
+
+def timed(name=None):
+    ''' decorator timing every call of a function under name (default the
+        function's name). Does nothing unless instrumentation is ENABLED '''
+    def decorate(function):
+        if not ENABLED:
+            return function
+        label = name or function.__name__
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            start = default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_time(label, default_timer() - start)
+        return timed_function
+    return decorate
+
+def time_method(obj, attribute, name):
+    ''' time the calls of obj's method (e.g. a canvas' draw) from now on.
+        Does nothing unless instrumentation is ENABLED '''
+    if ENABLED:
+        setattr(obj, attribute, timed(name)(getattr(obj, attribute)))
+
+def stats():
+    ''' {'timings': {name: {calls, total, mean, max}}, 'counters': {name: total}} '''
+    with _lock:
+        timings = dict((name, {'calls': calls, 'total': total,
+                               'mean': total/calls, 'max': longest})
+                       for name, (calls, total, longest) in TIMINGS.items())
+        return {'timings': timings, 'counters': dict(COUNTERS)}
+
+def summary(names=None):
+    ''' one line readout of the mean times of names (default all of them)
+        and the counters, e.g. for a status bar '''
+    current = stats()
+    timings = current['timings']
+    names = [name for name in (names or sorted(timings)) if name in timings]
+    parts = ['%s %.1f ms' % (name, 1000*timings[name]['mean']) for name in names]
+    parts += ['%s %d' % item for item in sorted(current['counters'].items())]
+    return ' | '.join(parts)
+
+def dump(filename):
+    ''' write the stats to a .json file '''
+    with open(filename, 'w') as f:
+        json.dump(stats(), f, indent=1, sort_keys=True)
+
+def reset():
+    ''' forget all the timings and counters '''
+    with _lock:
+        TIMINGS.clear()
+        COUNTERS.clear()
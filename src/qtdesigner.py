@@ -269,6 +269,9 @@ class Ui_WaveguideViewer_MainWindow(object):
         self.H_field_checkBox.setTristate(False)
         self.H_field_checkBox.setObjectName(_fromUtf8("H_field_checkBox"))
         self.verticalLayout_7.addWidget(self.H_field_checkBox)
+        self.animate_checkBox = QtGui.QCheckBox(self.tab)
+        self.animate_checkBox.setObjectName(_fromUtf8("animate_checkBox"))
+        self.verticalLayout_7.addWidget(self.animate_checkBox)
         spacerItem10 = QtGui.QSpacerItem(20, 20, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Fixed)
         self.verticalLayout_7.addItem(spacerItem10)
         self.horizontalLayout_8 = QtGui.QHBoxLayout()
@@ -390,6 +393,7 @@ class Ui_WaveguideViewer_MainWindow(object):
         self.label_9.setText(QtGui.QApplication.translate("WaveguideViewer_MainWindow", "<b>Vector Field Plot</b>", None, QtGui.QApplication.UnicodeUTF8))
         self.E_field_checkBox.setText(QtGui.QApplication.translate("WaveguideViewer_MainWindow", "Electric Field", None, QtGui.QApplication.UnicodeUTF8))
         self.H_field_checkBox.setText(QtGui.QApplication.translate("WaveguideViewer_MainWindow", "Magnetic Field", None, QtGui.QApplication.UnicodeUTF8))
+        self.animate_checkBox.setText(QtGui.QApplication.translate("WaveguideViewer_MainWindow", "Animate", None, QtGui.QApplication.UnicodeUTF8))
         self.label_7.setText(QtGui.QApplication.translate("WaveguideViewer_MainWindow", "Number of radial points", None, QtGui.QApplication.UnicodeUTF8))
         self.label_8.setText(QtGui.QApplication.translate("WaveguideViewer_MainWindow", "Number of angle points", None, QtGui.QApplication.UnicodeUTF8))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab), QtGui.QApplication.translate("WaveguideViewer_MainWindow", "Field Plot", None, QtGui.QApplication.UnicodeUTF8))
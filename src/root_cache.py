@@ -0,0 +1,194 @@
+''' Persistent table of solved waveguide mode roots chi_mn, so that modes
+    that have been solved once are just looked up afterwards. (kz isn't kept,
+    as it depends on each mode's wavelength and medium.)
+
+    Roots are stored in a compact .npz file as a sorted array of integer keys
+    built from (mode, m, n, quantized c), with the roots alongside. An
+    in-memory LRU sits in front of the table for repeated lookups.
+
+    Populate it in bulk from the command line, e.g.
+        python root_cache.py --mode TE TM --m-max 50 --n-max 30 --c 1.5 2 3.2 '''
+
+import os
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+import coaxial_modes
+from coaxial_modes import find_roots
+
+# default location of the root table
+DEFAULT_FILENAME = os.path.join(os.path.expanduser('~'), '.waveguide_roots.npz')
+
+# c values are quantized to this resolution before being used as a key
+C_RESOLUTION = 1e-9
+# c closer to 1 than this isn't cached, but solved exactly every time: the roots
+# go like pi/(c-1), so quantizing c would move them by up to C_RESOLUTION/2/(c-1)
+# (and c just above 1 would be quantized to 1)
+MIN_C_GAP = 1e-3
+
+# bits of the integer key given to m, n and quantized c (mode gets the top bit)
+M_BITS, N_BITS, C_BITS = 10, 10, 40
+MODE_CODES = {'TE': 0, 'TM': 1}
+
+
+def make_keys(mode, m, n, c):
+    ''' integer table key(s) for (mode, m, n, c), c is quantized to C_RESOLUTION '''
+    m, n = np.asarray(m, dtype=np.int64), np.asarray(n, dtype=np.int64)
+    cq = np.round(np.asarray(c, dtype=float)/C_RESOLUTION).astype(np.int64)
+    if np.any(m >= 2**M_BITS) or np.any(n >= 2**N_BITS) or np.any(cq >= 2**C_BITS):
+        raise ValueError('m, n or c too large to be cached')
+    key = np.int64(MODE_CODES[mode])
+    key = (key << M_BITS) | m
+    key = (key << N_BITS) | n
+    return (key << C_BITS) | cq
+
+def quantize_c(c):
+    ''' the c value a cached root is actually solved at '''
+    return np.round(np.asarray(c, dtype=float)/C_RESOLUTION)*C_RESOLUTION
+
+def cacheable(c):
+    ''' whether roots at c can be kept in the table (see MIN_C_GAP) '''
+    return np.asarray(c, dtype=float) - 1 >= MIN_C_GAP
+
+
+class RootCache:
+    ''' On-disk table of roots keyed by (mode, m, n, c), with an
+        in-memory LRU of the most recent lookups in front of it '''
+
+    def __init__(self, filename=DEFAULT_FILENAME, lru_size=1024):
+        self.filename = filename
+        self.lru_size = lru_size
+        self.lru = OrderedDict()    # key -> root
+
+        # the sorted table of keys and roots
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.roots = np.zeros(0)
+        self.modified = False       # has the table changed since load / save
+
+        if filename is not None and os.path.exists(filename):
+            self.load()
+
+    def __len__(self):
+        return self.keys.size
+
+    def load(self):
+        ''' read the root table from file '''
+        with np.load(self.filename) as table:
+            self.keys = table['keys']
+            self.roots = table['roots']
+        self.lru.clear()
+        self.modified = False
+
+    def save(self):
+        ''' write the root table to file (only if it has changed) '''
+        if self.filename is None or not self.modified: return
+        # write to a temporary file first so a crash can't corrupt the table
+        temp = self.filename + '.tmp.npz'
+        np.savez(temp, keys=self.keys, roots=self.roots)
+        # os.rename won't overwrite an existing file on windows
+        if os.name == 'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(temp, self.filename)
+        self.modified = False
+
+    def lookup(self, keys):
+        ''' index into the table of each key, and whether it was found '''
+        index = np.searchsorted(self.keys, keys).clip(0, max(self.keys.size-1, 0))
+        if self.keys.size == 0:
+            return index, np.zeros(np.shape(keys), dtype=bool)
+        return index, self.keys[index] == keys
+
+    def insert(self, keys, roots):
+        ''' add new entries to the table, keeping it sorted '''
+        keys, roots = np.ravel(keys), np.ravel(roots)
+        keys, first = np.unique(keys, return_index=True)
+        index = np.searchsorted(self.keys, keys)
+        self.keys = np.insert(self.keys, index, keys)
+        self.roots = np.insert(self.roots, index, roots[first])
+        self.modified = True
+
+    def get(self, mode, m, n, c):
+        ''' root of a single mode, solving (and storing) it if necessary '''
+        if not cacheable(c):
+            return float(find_roots(mode, m, n, c))
+        key = int(make_keys(mode, m, n, quantize_c(c)))
+        if key in self.lru:
+            # move to the most recently used end
+            value = self.lru.pop(key)
+        else:
+            value = float(self.get_many(mode, m, n, c))
+            if not np.isfinite(value):
+                return value
+
+        self.lru[key] = value
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+        return value
+
+    def get_many(self, mode, m, n, c):
+        ''' roots for arrays of (m, n, c) broadcast against each other.
+            Any that aren't in the table are solved together with find_roots.
+            Roots that can't be found (nan) aren't stored, nor are any for c 
+            too close to 1 (see MIN_C_GAP) '''
+        m, n, c = np.broadcast_arrays(m, n, np.asarray(c, dtype=float))
+        roots = np.zeros(m.shape)
+        exact = ~cacheable(c)
+        if exact.any():
+            roots[exact] = find_roots(mode, m[exact], n[exact], c[exact])
+            if exact.all():
+                return roots
+
+        cached = ~exact
+        m, n, c = m[cached], n[cached], quantize_c(c[cached])
+        keys = make_keys(mode, m, n, c)
+        index, found = self.lookup(keys)
+        values = np.zeros(keys.shape)
+        values[found] = self.roots[index[found]]
+
+        missing = ~found
+        if missing.any():
+            solved = find_roots(mode, m[missing], n[missing], c[missing])
+            values[missing] = solved
+            ok = np.isfinite(solved)
+            if ok.any():
+                self.insert(keys[missing][ok], solved[ok])
+
+        roots[cached] = values
+        return roots
+
+    def precompute(self, modes, m_max, n_max, c_values):
+        ''' solve and store every root for m = 0..m_max, n = 1..n_max and each c '''
+        m = np.arange(m_max+1)[:,None,None]
+        n = np.arange(1, n_max+1)[None,:,None]
+        c = np.asarray(c_values, dtype=float)[None,None,:]
+        for mode in modes:
+            self.get_many(mode, m, n, c)
+
+
+def enable(filename=DEFAULT_FILENAME, lru_size=1024):
+    ''' make TEmode / TMmode look up their roots in a RootCache (returned) '''
+    coaxial_modes.ROOT_CACHE = RootCache(filename, lru_size)
+    return coaxial_modes.ROOT_CACHE
+
+def disable():
+    ''' stop TEmode / TMmode from using the root cache '''
+    coaxial_modes.ROOT_CACHE = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='precompute a table of coaxial waveguide roots')
+    parser.add_argument('--mode', nargs='+', default=['TE', 'TM'], choices=sorted(MODE_CODES))
+    parser.add_argument('--m-max', type=int, default=10, help='largest m to solve')
+    parser.add_argument('--n-max', type=int, default=10, help='largest n to solve')
+    parser.add_argument('--c', type=float, nargs='+', required=True,
+                        help='ratios of outer to inner radius')
+    parser.add_argument('--file', default=DEFAULT_FILENAME, help='root table file')
+    args = parser.parse_args()
+
+    cache = RootCache(args.file)
+    before = len(cache)
+    cache.precompute(args.mode, args.m_max, args.n_max, args.c)
+    cache.save()
+    print('%s: %d roots (%d new)' % (args.file, len(cache), len(cache)-before))
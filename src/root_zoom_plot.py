@@ -1,41 +1,69 @@
 ''' used to plot bessel function roots. Inherits all ZoomPlot
-    features, but changes the plotted range '''
+    features, but changes the plotted range, and samples the function
+    adaptively (more points near roots and poles) rather than uniformly '''
     
 from interactive_plot import ZoomPlot
 from errors import NotNumpyArray
+from bracketing import first_sign_change
+from sampling import adaptive_sample
 
 import numpy as np
 
 class RootZoomPlot(ZoomPlot):
+    
+    def __init__(self, f, Npoints=400, x_min=0, x_max=1, **kwargs):
+        # what we need to sample the function ourselves (set before ZoomPlot
+        # initializes, in case it sets the x range)
+        self.function = f
+        self.Npoints = Npoints
+        self.x_min, self.x_max = x_min, x_max
+        ZoomPlot.__init__(self, f, Npoints=Npoints, x_min=x_min, x_max=x_max, **kwargs)
+    
+    def get_xlim(self):
+        ''' the x range being plotted '''
+        return self.x_min, self.x_max
+    
+    def set_xlim(self, x_min, x_max):
+        ''' plot the function over a new x range. Rather than Npoints evenly 
+            spaced points, the function is sampled adaptively with (at most) 
+            Npoints points, concentrated near roots, poles and sharp bends.
+            An empty range raises ValueError, leaving the plot as it was '''
+        x, y = adaptive_sample(self.function, x_min, x_max, self.Npoints)
+        # (the samples run from the smaller end of the range to the larger)
+        self.x_min, self.x_max = x[0], x[-1]
+        self.x, self.y = x, y
+        self.line.set_data(self.x, self.y)
+        self.line.axes.set_xlim(self.x_min, self.x_max)
+        self.canvas.draw_idle()
+    
+    def set_Npoints(self, Npoints):
+        ''' the most points to sample the function at (takes effect the next 
+            time the x range is set / the function is plotted) '''
+        self.Npoints = Npoints
         
     def get_ylim(self):
         ''' Used for plotting Bessel functions nicely
-            As Bessel functions diverge for x->0, this finds maximum value of Y range to plot.'''
+            As Bessel functions diverge for x->0, this finds maximum value of Y range to plot.
+            inf / nan values (where the Bessel functions have overflowed) are ignored'''
         
         # convenience variable
-        y = self.y
+        y = np.asarray(self.y)
+        finite = np.isfinite(y)
+        # nothing sensible to plot
+        if not finite.any():
+            return -1, 1
                 
-        # return +1 or -1 for each y value of the plotted line
-        ysign = np.sign(y)
-        
-        # Go through fsign array from beginning, and get index of first sign change
-        N = ysign.size # number of elements
-        current_sign = False # holds the current sign value
-        index = -1
-        for i in range(1,N):
-            if current_sign == False:
-                current_sign = ysign[i]
-                continue
-            elif current_sign*ysign[i]==-1:
-                index = i
-                break
+        # index of first sign change (after the first element)
+        N = y.size # number of elements
+        index = first_sign_change(y, start=1)
             
         # if no sign change is found, index = -1, and we'll just use a standard range
         # likewise if sign change occurs on last element
         if index==-1 or index==(N-1):
-            return y.min(),y.max()
+            return y[finite].min(),y[finite].max()
         else:   
-            max = np.abs(y[index:-1]).max()
+            tail = y[index:-1]
+            max = np.abs(tail[np.isfinite(tail)]).max()
             return -1.1*max, 1.1*max
         
     def plot(self, color='blue', linewidth=1):
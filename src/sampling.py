@@ -0,0 +1,148 @@
+''' Adaptive sampling of functions for plotting: points are concentrated near
+    zero crossings, sharp bends / steep jumps and poles (where the function
+    overflows), rather than spread uniformly, so curves like the radial root
+    equations look right near their roots with far fewer evaluations.
+    
+    Samples are taken on a power of two (dyadic) lattice of x values, so the 
+    same x values come up again when zooming or changing the number of points,
+    and a SampleCache can hand them back without evaluating the function '''
+
+import numpy as np
+
+from bracketing import first_sign_change, sign_changes
+
+# an interval needing less than this correction (as a fraction of the
+# visible y range) isn't worth splitting
+TOLERANCE = 1e-3
+# a single step bigger than this fraction of the visible y range is "steep"
+STEEP = 0.25
+# never split an interval narrower than this fraction of the x range
+MIN_WIDTH = 1e-9
+
+
+class SampleCache:
+    ''' Wraps a function of an array of x values, remembering every (x, f(x)) 
+        it has evaluated in sorted arrays. Calling it only evaluates the 
+        function at x values it hasn't seen before '''
+    
+    def __init__(self, f, max_points=10**6):
+        self.f = f
+        self.max_points = max_points    # forget everything beyond this many points
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.evaluations = 0    # number of x values the function was evaluated at
+        
+    def __len__(self):
+        return self.x.size
+        
+    def lookup(self, x):
+        ''' index into the cache of each x value, and whether it's there '''
+        index = np.searchsorted(self.x, x).clip(0, max(self.x.size-1, 0))
+        if self.x.size == 0:
+            return index, np.zeros(x.shape, dtype=bool)
+        return index, self.x[index] == x
+    
+    def __call__(self, x):
+        ''' f(x), only evaluating the x values that aren't cached '''
+        x = np.asarray(x, dtype=float)
+        index, found = self.lookup(x)
+        if not found.all():
+            new_x = np.unique(x[~found])
+            with np.errstate(all='ignore'):
+                new_y = np.asarray(self.f(new_x), dtype=float)
+            self.evaluations += new_x.size
+            if self.x.size + new_x.size > self.max_points:
+                self.x, self.y = np.zeros(0), np.zeros(0)
+            position = np.searchsorted(self.x, new_x)
+            self.x = np.insert(self.x, position, new_x)
+            self.y = np.insert(self.y, position, new_y)
+            index, found = self.lookup(x)
+        return self.y[index]
+    
+    def clear(self):
+        ''' forget all the cached values '''
+        self.x, self.y = np.zeros(0), np.zeros(0)
+
+
+def dyadic_grid(x_min, x_max, n):
+    ''' about n points from x_min to x_max (inclusive), all but the end points
+        at multiples of a power of 2, so grids for overlapping ranges or 
+        doubled / halved n share most of their points '''
+    span = float(x_max - x_min)
+    if not span > 0:
+        raise ValueError('x_max must be greater than x_min')
+    step = 2.**np.floor(np.log2(span/max(n-1, 1)))
+    inner = step*np.arange(np.floor(x_min/step)+1, np.ceil(x_max/step))
+    return np.concatenate(([x_min], inner[(inner > x_min) & (inner < x_max)], [x_max]))
+
+def visible_scale(y):
+    ''' half the y range the function would be plotted over: the largest
+        value after the first sign change (as Bessel functions diverge as
+        x->0), or the largest finite value if the sign never changes '''
+    finite = np.isfinite(y)
+    if not finite.any():
+        return 1.
+    index = first_sign_change(y, start=1)
+    tail = y[index:] if index != -1 else y
+    scale = np.abs(tail[np.isfinite(tail)]).max()
+    return scale if scale > 0 else 1.
+
+def interval_scores(x, y, budget):
+    ''' how much each interval [x_i, x_i+1] needs splitting, > TOLERANCE if it does '''
+    span = x[-1] - x[0]
+    scale = visible_scale(y)
+    # work in units of the plotted area, with poles clipped just off the plot
+    u = (x - x[0])/span
+    with np.errstate(invalid='ignore'):
+        v = np.clip(y/scale, -2, 2)
+    v = np.where(np.isfinite(v), v, 0)
+    width = np.diff(u)
+
+    # how far each interior point is from the straight line through its neighbours
+    bend = np.zeros(x.size)
+    t = (u[1:-1] - u[:-2])/(u[2:] - u[:-2])
+    bend[1:-1] = np.abs(v[1:-1] - (v[:-2] + t*(v[2:] - v[:-2])))
+    scores = np.maximum(bend[:-1], bend[1:])
+
+    # steep jumps
+    scores += np.maximum(np.abs(np.diff(v)) - STEEP, 0)
+    # zero crossings and poles, split until narrower than an even share of the budget
+    finite = np.isfinite(y)
+    special = sign_changes(y) | ~finite[:-1] | ~finite[1:]
+    scores += special*width*TOLERANCE*budget
+    # (but don't split intervals down to rounding error, e.g. next to a pole)
+    scores[width < MIN_WIDTH] = 0
+    return scores
+
+def adaptive_sample(f, x_min, x_max, budget=400, initial=None):
+    ''' Sample f (which takes an array of x values) between x_min and x_max
+        with at most budget points, returning sorted arrays (x, f(x)).
+        Starts from a uniform (dyadic) grid of about initial points (default 
+        budget/8), then repeatedly splits the intervals that most need it in
+        half, evaluating f only at the new points. Wrap f in a SampleCache to 
+        reuse evaluations between calls. A reversed range is sampled from the
+        smaller end, an empty (or non-finite) range is a ValueError '''
+    if not (np.isfinite(x_min) and np.isfinite(x_max)) or x_min == x_max:
+        raise ValueError('can\'t sample the range %r to %r' % (x_min, x_max))
+    x_min, x_max = min(x_min, x_max), max(x_min, x_max)
+    budget = max(int(budget), 2)
+    initial = initial or max(16, budget//8)
+    x = dyadic_grid(x_min, x_max, min(initial, budget))
+    with np.errstate(all='ignore'):
+        y = np.asarray(f(x), dtype=float)
+
+    while x.size < budget:
+        scores = interval_scores(x, y, budget)
+        wanted = (scores > TOLERANCE).nonzero()[0]
+        if wanted.size == 0:
+            break
+        # split the worst intervals first, at most doubling the points each round
+        wanted = wanted[np.argsort(-scores[wanted])][:budget - x.size]
+        wanted.sort()
+        x_new = (x[wanted] + x[wanted+1])/2.
+        with np.errstate(all='ignore'):
+            y_new = np.asarray(f(x_new), dtype=float)
+        x = np.insert(x, wanted+1, x_new)
+        y = np.insert(y, wanted+1, y_new)
+
+    return x, y
@@ -0,0 +1,189 @@
+''' Superpositions of several modes of the same waveguide (the same c), each
+    with a complex amplitude (magnitude and phase).
+
+    The field of each mode is evaluated once on the (n_rho x n_phi) grid and
+    kept, so changing the amplitudes only redoes the weighted sum, without
+    evaluating any Bessel functions.
+
+    e.g.
+        modes = [TEmode(1,1,3.2), TMmode(1,1,3.2)]
+        for mode in modes: mode.find_root()
+        mix = Superposition(modes, [1, 0.5j])
+        mix.plot_field(ax)
+        mix.set_amplitude(1, 0.8, phase=pi/4)
+        mix.plot_field(ax)     # only the sum (and arrows) are redone
+
+    A mode's basis field is redone whenever its root, kz, wavelength or medium
+    has changed since it was evaluated, so the modes can be changed directly as
+    well as through set_medium '''
+
+import numpy as np
+from numpy import array, asarray, cos, sin, exp, linspace, meshgrid, pi, tensordot
+
+from coaxial_modes import FieldPlot, FIELD_COMPONENTS, field_array
+
+
+def mode_label(mode):
+    ''' e.g. TE1,2 or TEM '''
+    if mode.mode == 'TEM':
+        return 'TEM'
+    return '%s%d,%d' % (mode.mode, mode.m, mode.n)
+
+def basis_key(mode):
+    ''' what the fields of a mode depend on that can change (its root, kz,
+        wavelength and medium), its basis field is redone when this changes '''
+    # (TEM modes have no root, theirs is None)
+    return (getattr(mode, 'root', None), mode.kz, mode.wavelength, mode.epsilon, mode.mu)
+
+
+class Superposition(FieldPlot, object):
+    ''' The field sum_i a_i F_i of modes F_i with complex amplitudes a_i.
+        The (real) field shown at a time phase wt is Re(sum_i a_i F_i exp(i wt)).
+        It has the field methods of a single mode (fields, field_arrows and 
+        plot_field), not its root finding '''
+
+    def __init__(self, modes, amplitudes=None):
+        modes = list(modes)
+        if len(modes) == 0:
+            raise ValueError('a superposition needs at least one mode')
+        c = modes[0].c
+        if [mode for mode in modes if mode.c != c]:
+            raise ValueError('all the modes must be in the same waveguide (same c)')
+        medium = (modes[0].wavelength, modes[0].epsilon, modes[0].mu)
+        if [mode for mode in modes if (mode.wavelength, mode.epsilon, mode.mu) != medium]:
+            raise ValueError('all the modes must have the same wavelength and medium')
+
+        self.mode = 'superposition'
+        self.c = c
+        self.modes = modes
+        if amplitudes is None:
+            amplitudes = np.ones(len(modes))
+        self.amplitudes = asarray(amplitudes, dtype=complex).copy()
+        if self.amplitudes.shape != (len(modes),):
+            raise ValueError('need one amplitude per mode')
+        self.phase = 0.     # time phase wt of the field shown
+
+        self.grid = None        # (n_rho, n_phi) the basis fields are on
+        self.basis = None       # basis[i] = fields of modes[i] on the grid
+        self.basis_keys = None  # basis_key of each mode when its basis was found
+        self.basis_done = None  # which modes' basis fields have been found
+        self.total = None       # sum_i a_i basis[i] (complex)
+        self.total_z = None     # the distance z along the guide of the total
+
+        self.E_field = None # The quiver / arrow plot of the Electric field
+        self.H_field = None # "                            " Magnetic field
+        self.field_ax = None    # the polar axis the fields were plotted in
+        self.field_grid = None  # (n_rho, n_phi) of the plotted arrows
+
+    def __str__(self):
+        return '<superposition>  ' + ' + '.join(
+            '(%.3g%+.3gj) %s' % (a.real, a.imag, mode_label(mode))
+            for a, mode in zip(self.amplitudes, self.modes))
+
+    def get_field_plot_title(self):
+        ''' the title given to the vector field plot '''
+        return ' + '.join(mode_label(mode) for mode in self.modes)
+
+    def set_amplitude(self, i, amplitude, phase=0.):
+        ''' set the amplitude of the ith mode to amplitude*exp(i*phase) '''
+        self.amplitudes[i] = amplitude*exp(1j*phase)
+        self.total = None
+
+    def set_amplitudes(self, amplitudes):
+        ''' set all the (complex) amplitudes at once '''
+        amplitudes = asarray(amplitudes, dtype=complex)
+        if amplitudes.shape != self.amplitudes.shape:
+            raise ValueError('need one amplitude per mode')
+        self.amplitudes[:] = amplitudes
+        self.total = None
+
+    def set_medium(self, wavelength=None, epsilon=None, mu=None, update=True):
+        ''' set the wavelength / medium of every mode (see TMmode.set_medium),
+            the basis fields depend on it so are recalculated when next needed '''
+        for mode in self.modes:
+            mode.set_medium(wavelength, epsilon, mu, update)
+
+    def set_phase(self, phase):
+        ''' show the field at time phase wt (nothing is recalculated) '''
+        self.phase = phase
+
+    def grid_points(self, n_rho, n_phi):
+        ''' the rho and phi values of the grid (1d) '''
+        return linspace(1, self.c, n_rho), linspace(0, 2*pi, n_phi)
+
+    def basis_fields(self, n_rho=15, n_phi=60):
+        ''' the fields of every mode on the grid, an array of shape
+            (number of modes, len(FIELD_COMPONENTS), n_phi, n_rho). Only the
+            modes that are new to this grid, or whose basis_key has changed,
+            are evaluated '''
+        keys = [basis_key(mode) for mode in self.modes]
+        if self.grid != (n_rho, n_phi):
+            self.grid = (n_rho, n_phi)
+            self.basis = np.empty((len(self.modes), len(FIELD_COMPONENTS), n_phi, n_rho))
+            self.basis_done = [False]*len(self.modes)
+            self.basis_keys = [None]*len(self.modes)
+            stale = range(len(self.modes))
+        else:
+            stale = [i for i in range(len(self.modes))
+                     if not self.basis_done[i] or self.basis_keys[i] != keys[i]]
+
+        if stale:
+            rho, phi = self.grid_points(n_rho, n_phi)
+            for i in stale:
+                self.modes[i].fields(rho[None,:], phi[:,None], out=self.basis[i])
+                self.basis_done[i] = True
+                self.basis_keys[i] = keys[i]
+            self.total = None
+        return self.basis
+
+    def propagation(self, z):
+        ''' exp(-i kz z) of each mode, its phase a distance z along the guide '''
+        kz = array([mode.kz for mode in self.modes])
+        return exp(-1j*kz*z)
+
+    def complex_fields(self, n_rho=15, n_phi=60, z=0.):
+        ''' sum_i a_i F_i exp(-i kz_i z) on the grid at a distance z along the
+            guide, a complex array of shape (len(FIELD_COMPONENTS), n_phi, n_rho) '''
+        basis = self.basis_fields(n_rho, n_phi)
+        if self.total is None or self.total_z != z:
+            weights = self.amplitudes if z == 0 else self.amplitudes*self.propagation(z)
+            self.total = tensordot(weights, basis, axes=1)
+            self.total_z = z
+        return self.total
+
+    def snapshot(self, n_rho=15, n_phi=60, phase=None):
+        ''' the real field on the grid at time phase wt (default self.phase),
+            Re(total*exp(i wt)) = Re(total)*cos(wt) - Im(total)*sin(wt) '''
+        phase = self.phase if phase is None else phase
+        total = self.complex_fields(n_rho, n_phi)
+        return total.real*cos(phase) - total.imag*sin(phase)
+
+    def fields(self, rho, phi, out=None):
+        ''' the real field at any (rho, phi) points at time phase self.phase
+            (not cached, see snapshot for the field on the grid) '''
+        rho, phi = asarray(rho, dtype=float), asarray(phi, dtype=float)
+        weights = (self.amplitudes*exp(1j*self.phase)).real
+        total = None
+        for weight, mode in zip(weights, self.modes):
+            F = weight*mode.fields(rho, phi)
+            total = F if total is None else total + F
+        if out is None:
+            return total
+        out = field_array(total.shape[1:], out)
+        out[...] = total
+        return out
+
+    def field_arrows(self, n_rho=15, n_phi=60):
+        ''' (RHO, PHI, fields) on the grid, as plot_field draws '''
+        RHO, PHI = meshgrid(*self.grid_points(n_rho, n_phi))
+        return RHO, PHI, self.snapshot(n_rho, n_phi)
+
+    def field_columns(self, n_rho=15, n_phi=60):
+        ''' columns (rho, phi, then the real and imaginary parts of each
+            component) of the complex field, e.g. for waveguide_batch.write_columns '''
+        RHO, PHI = meshgrid(*self.grid_points(n_rho, n_phi))
+        total = self.complex_fields(n_rho, n_phi)
+        columns = [('rho', RHO), ('phi', PHI)]
+        for name, F in zip(FIELD_COMPONENTS, total):
+            columns += [(name + '_re', F.real.copy()), (name + '_im', F.imag.copy())]
+        return columns
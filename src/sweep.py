@@ -0,0 +1,124 @@
+''' Parameter sweeps of the roots chi_mn over many values of the radius ratio c,
+    spread over a pool of worker processes.
+
+    The sweep is split into tasks of (mode, m, chunk of c values), each solving
+    every n = 1..n_max at once. Tasks are sized by an estimate of how much work
+    they are (high m modes need the root equation scanned over a much longer
+    range) and handed out largest first, and each result is written to a .npy
+    file (memory-mapped) as soon as it comes back, so an interrupted sweep can
+    be resumed.
+
+    e.g.
+        python sweep.py --mode TE TM --m 0:50 --n-max 30 --c 1.1:10:0.01 --out roots.npy '''
+
+import os
+import argparse
+import multiprocessing
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from coaxial_modes import find_roots, SAMPLES_PER_ROOT
+
+
+def task_cost(m, n_max, c):
+    ''' rough relative cost of solving n = 1..n_max for (m, c): the number of
+        samples of the root equation needed to scan from m/c up past the
+        n_max root (which is at most about m + n_max*pi/(c-1)) '''
+    c = np.asarray(c, dtype=float)
+    return SAMPLES_PER_ROOT*(n_max + m*(c-1)*(1-1/c)/np.pi) + 1
+
+def make_tasks(modes, m_values, n_max, c_values, tasks_per_process=8, processes=1):
+    ''' split the sweep into tasks (mode index, m index, c indices), each of
+        roughly the same cost, ordered largest first '''
+    cost = np.array([task_cost(m, n_max, c_values) for m in m_values])
+    # aim for several tasks per process so the pool stays balanced
+    target = len(modes)*cost.sum()/float(processes*tasks_per_process)
+
+    tasks = []
+    for i in range(len(modes)):
+        for j in range(len(m_values)):
+            # cut the c values into runs with total cost no more than target
+            chunk = (np.cumsum(cost[j])/target).astype(int)
+            for k in np.unique(chunk):
+                c_index = (chunk == k).nonzero()[0]
+                tasks.append((cost[j, c_index].sum(), (i, j, c_index)))
+
+    # largest tasks first (so no big task is left until the end)
+    tasks.sort(key=lambda task: -task[0])
+    return [task for cost, task in tasks]
+
+def solve_task(arguments):
+    ''' solve one task in a worker process, returns (task, roots[n, c]) '''
+    mode, m, n_max, c, task = arguments
+    n = np.arange(1, n_max+1)[:,None]
+    return task, find_roots(mode, m, n, c[None,:])
+
+def sweep(modes, m_values, n_max, c_values, filename, processes=None,
+          resume=True, callback=None):
+    ''' Solve the roots chi_mn of every mode, m in m_values, n = 1..n_max and c
+        in c_values using a pool of processes (default: one per cpu).
+        Results are written to filename (.npy) as they come in, as an array
+        roots[mode, m, n-1, c], which is returned (memory-mapped).
+        If resume is True and filename already holds a sweep of the same
+        shape, only the tasks that haven't been solved yet are run.
+        callback(done, total) is called after each task finishes '''
+    m_values = np.asarray(m_values, dtype=int)
+    c_values = np.asarray(c_values, dtype=float)
+    shape = (len(modes), len(m_values), n_max, len(c_values))
+    processes = processes or multiprocessing.cpu_count()
+
+    if resume and os.path.exists(filename):
+        roots = np.load(filename, mmap_mode='r+')
+        if roots.shape != shape:
+            raise ValueError('%s holds a sweep of shape %s, not %s'
+                             % (filename, roots.shape, shape))
+    else:
+        roots = open_memmap(filename, mode='w+', dtype=float, shape=shape)
+        roots[...] = np.nan
+
+    tasks = make_tasks(modes, m_values, n_max, c_values, processes=processes)
+    # unsolved entries are nan, skip any task that's already complete
+    tasks = [(i, j, c_index) for (i, j, c_index) in tasks
+             if np.isnan(roots[i, j][:, c_index]).any()]
+    arguments = [(modes[i], m_values[j], n_max, c_values[c_index], (i, j, c_index))
+                 for (i, j, c_index) in tasks]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # take results in the order they finish, not the order submitted
+        for done, ((i, j, c_index), result) in enumerate(
+                pool.imap_unordered(solve_task, arguments), 1):
+            roots[i, j][:, c_index] = result
+            roots.flush()
+            if callback is not None:
+                callback(done, len(tasks))
+    finally:
+        pool.close()
+        pool.join()
+    return roots
+
+
+if __name__ == '__main__':
+    from waveguide_batch import parse_values
+    import sys
+
+    parser = argparse.ArgumentParser(description='sweep the roots chi_mn over c')
+    parser.add_argument('--mode', nargs='+', default=['TE', 'TM'], choices=['TE', 'TM'])
+    parser.add_argument('--m', default='0:10', help='m values e.g. 0:50')
+    parser.add_argument('--n-max', type=int, default=10, help='largest n to solve')
+    parser.add_argument('--c', required=True, help='c values e.g. 1.1:10:0.01')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per cpu)')
+    parser.add_argument('--restart', action='store_true',
+                        help='start again rather than resuming an existing sweep')
+    parser.add_argument('--out', default='roots.npy', help='output .npy file')
+    args = parser.parse_args()
+
+    def progress(done, total):
+        sys.stdout.write('\r%d / %d tasks' % (done, total))
+        sys.stdout.flush()
+
+    sweep(args.mode, parse_values(args.m, int), args.n_max, parse_values(args.c),
+          args.out, args.processes, resume=not args.restart, callback=progress)
+    sys.stdout.write('\n%s: roots[mode, m, n-1, c] for modes %s\n' % (args.out, args.mode))
@@ -0,0 +1,77 @@
+''' Tests of propagating_modes against a brute force grid of cutoffs.
+
+    Run with e.g.
+        python -m unittest test_propagating_modes '''
+
+import unittest
+
+import numpy as np
+from numpy import pi
+
+from coaxial_modes import find_roots, propagating_modes
+
+# (c, k) to list the modes of, from a few modes to a few hundred
+CASES = [(1.5, 4.), (3.2, 5.), (2., 20.), (1.1, 40.)]
+
+
+def brute_force_modes(c, k, modes=('TE', 'TM')):
+    ''' {(mode, m, n): chi} of every mode with chi < k, solving a grid of m, n
+        big enough to hold them all (chi_mn > m/c, and about (n-1)*pi/(c-1)) '''
+    m_max = int(np.ceil(k*c)) + 1
+    n_max = int(k*(c-1)/pi) + 3
+    m = np.arange(m_max+1)[:,None]
+    n = np.arange(1, n_max+1)[None,:]
+    found = {}
+    for mode in modes:
+        chi = find_roots(mode, m, n, c)
+        # (make sure the grid went past k in both directions)
+        assert (chi[-1] >= k).all() and (chi[:,-1] >= k).all()
+        for i, j in zip(*(chi < k).nonzero()):
+            found[(mode, int(m[i,0]), int(n[0,j]))] = chi[i,j]
+    return found
+
+
+class PropagatingModesTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        for c, k in CASES:
+            expected = brute_force_modes(c, k)
+            listed = propagating_modes(c, k)
+            self.assertEqual(len(listed), len(expected))
+            chi = [mode[3] for mode in listed]
+            self.assertEqual(chi, sorted(chi))
+            for mode, m, n, root in listed:
+                self.assertAlmostEqual(root, expected[(mode, m, n)], places=10)
+
+    def test_one_mode_type(self):
+        c, k = 2., 20.
+        listed = propagating_modes(c, k, modes=('TM',))
+        self.assertEqual(set(mode[:3] for mode in listed), set(brute_force_modes(c, k, ('TM',))))
+
+    def test_max_modes(self):
+        c, k = 2., 20.
+        everything = propagating_modes(c, k)
+        for max_modes in (1, 5, len(everything)//2):
+            listed = propagating_modes(c, k, max_modes=max_modes)
+            self.assertEqual(len(listed), max_modes)
+            # the lowest max_modes modes (ties, e.g. TE0n = TM1n, may be in either order)
+            largest = max(mode[3] for mode in listed)
+            rest = [mode for mode in everything if mode not in listed]
+            self.assertTrue(all(mode[3] >= largest - 1e-9 for mode in rest))
+        self.assertEqual(propagating_modes(c, k, max_modes=10**6), everything)
+
+    def test_too_many_modes(self):
+        # without max_modes, far too many modes to list is an error
+        self.assertRaises(ValueError, propagating_modes, 2., 1e5)
+        self.assertEqual(len(propagating_modes(2., 1e5, max_modes=3)), 3)
+
+    def test_none_propagate(self):
+        # the lowest cutoff is the TE11 mode, at about 2/(1+c)
+        c = 3.2
+        self.assertEqual(propagating_modes(c, 0.1), [])
+        self.assertEqual(propagating_modes(c, 0.9*find_roots('TE', 1, 1, c)), [])
+        self.assertEqual(len(propagating_modes(c, 1.1*find_roots('TE', 1, 1, c))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+''' Regression tests of the batch root solver, checked against a dense scan
+    of the root equations for sign changes, each polished with brentq.
+
+    Run with e.g.
+        python -m unittest test_roots '''
+
+import unittest
+
+import numpy as np
+from numpy import pi
+from scipy.optimize import brentq
+from scipy.special import jn, yn, jvp, yvp
+
+from coaxial_modes import find_roots
+
+# the root equations written out directly with scipy, independently of
+# coaxial_modes (which shares the Bessel function evaluations)
+EQUATIONS = {
+    'TM': lambda m, c, x: yn(m,x)*jn(m,c*x) - jn(m,x)*yn(m,c*x),
+    'TE': lambda m, c, x: yvp(m,x,1)*jvp(m,c*x,1) - jvp(m,x,1)*yvp(m,c*x,1),
+}
+
+# (mode, m, c) to check the first N_ROOTS roots of: small m, c close to 1
+# (roots far apart) and large m (roots start well away from 0)
+CASES = [('TM', 0, 3.2), ('TE', 0, 3.2), ('TM', 2, 3.2), ('TE', 3, 3.2),
+         ('TE', 1, 1.05), ('TM', 0, 1.01), ('TE', 0, 1.001), ('TM', 1, 1.0001),
+         ('TM', 40, 1.5), ('TE', 40, 1.5), ('TE', 60, 2.5), ('TM', 60, 10.)]
+N_ROOTS = 6
+
+
+def scanned_roots(mode, m, c, n_roots, samples_per_root=200):
+    ''' the first n_roots roots, from sign changes of the root equation
+        sampled every pi/(c-1)/samples_per_root (the root spacing is about
+        pi/(c-1)) starting below m/c, as there are no roots below that '''
+    f = lambda x: EQUATIONS[mode](m, c, x)
+    step = pi/(c-1)/samples_per_root
+    x_start = max(0.5*m/c, 1e-3)
+    roots = []
+    while len(roots) < n_roots:
+        x = x_start + step*np.arange(samples_per_root*n_roots+1)
+        with np.errstate(all='ignore'):
+            y = f(x)
+        # (ignoring overflow, e.g. Y_m for x << m)
+        ok = np.isfinite(y[:-1]) & np.isfinite(y[1:])
+        for i in (ok & (np.sign(y[:-1]) != np.sign(y[1:]))).nonzero()[0]:
+            roots.append(brentq(f, x[i], x[i+1], xtol=1e-14, rtol=1e-14))
+        x_start = x[-1]
+    return np.array(roots[:n_roots])
+
+
+class FindRootsTest(unittest.TestCase):
+
+    def test_matches_scan(self):
+        for mode, m, c in CASES:
+            expected = scanned_roots(mode, m, c, N_ROOTS)
+            roots = find_roots(mode, m, np.arange(1, N_ROOTS+1), c)
+            np.testing.assert_allclose(roots, expected, rtol=1e-10,
+                                       err_msg='%s m=%d c=%g' % (mode, m, c))
+
+    def test_broadcasting(self):
+        # the same roots solved all together, in a 2d array
+        m = np.array([0, 3, 40])[:,None]
+        c = np.array([3.2, 3.2, 1.5])[:,None]
+        roots = find_roots('TE', m, np.arange(1, N_ROOTS+1)[None,:], c)
+        self.assertEqual(roots.shape, (3, N_ROOTS))
+        for row, (i, j) in zip(roots, [(0, 3.2), (3, 3.2), (40, 1.5)]):
+            np.testing.assert_allclose(row, scanned_roots('TE', i, j, N_ROOTS), rtol=1e-10)
+
+    def test_empty(self):
+        self.assertEqual(find_roots('TM', [], [], 2.).shape, (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+''' Command line (headless) batch tool for coaxial waveguide modes: solves the
+    roots of ranges of TE / TM modes and writes cutoff tables, dispersion
+    tables (kz, group velocity ... over a range of frequencies), lists of the
+    modes propagating at a wavelength and sampled field grids to .csv, .npz or
+    .h5 (HDF5, needs h5py) files. No GUI is needed.
+    Very large field grids can be written to .npy, which is filled a tile at a
+    time so the grid never has to fit in memory.
+
+    e.g.
+        python waveguide_batch.py table --mode TE TM --m 0:10 --n 1:5 --c 1.5:4:0.5 --out cutoffs.csv
+        python waveguide_batch.py dispersion --mode TE --m 0:3 --c 3.2 --omega 0:3e9 --points 100000 --out te.npz
+        python waveguide_batch.py modes --c 3.2 --wavelength 0.5 --out modes.csv
+        python waveguide_batch.py fields --mode TM --m 1 --n 1:3 --c 3.2 --out fields_{mode}{m}{n}.npz
+        python waveguide_batch.py fields --mode TE --m 2 --c 3.2 --n-rho 10000 --n-phi 10000 --out big.npy '''
+
+# (nothing here plots, and coaxial_modes only loads matplotlib when plotting,
+# so no plotting library or GUI toolkit is loaded at all)
+import os
+import argparse
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from coaxial_modes import TEmode, TMmode, TEMmode, find_roots, field_map, FIELD_COMPONENTS
+from coaxial_modes import wavenumber, cutoff_wavelength, dispersion, propagating_modes
+from coaxial_modes import C, LAMBDA, EPSILON, MU
+
+MODES = {'TE': TEmode, 'TM': TMmode}
+
+
+def parse_values(text, type=float):
+    ''' list of values from a command line string, either a comma separated
+        list "1,2,5" or an (inclusive) range "start:stop" / "start:stop:step" '''
+    values = []
+    for part in text.split(','):
+        if ':' not in part:
+            values.append(type(part))
+            continue
+        limits = [type(limit) for limit in part.split(':')]
+        start, stop = limits[0], limits[1]
+        step = limits[2] if len(limits) > 2 else type(1)
+        # include the end point (allowing for rounding in float steps)
+        number = int(np.floor((stop-start)/float(step) + 1e-9)) + 1
+        values.extend(type(value) for value in start + step*np.arange(number))
+    return values
+
+def write_columns(filename, columns):
+    ''' write an ordered list of (name, array) columns / arrays to filename,
+        the format is chosen from the extension (.csv, .npz, .h5 or .hdf5) '''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        names = [name for name, values in columns]
+        table = np.rec.fromarrays([np.ravel(values) for name, values in columns], names=names)
+        # strings (the mode column) as they are, numbers to 12 significant figures
+        fmt = ['%s' if table.dtype[i].kind in 'SU' else '%.12g' for i in range(len(names))]
+        np.savetxt(filename, table, delimiter=',', header=','.join(names),
+                   comments='', fmt=fmt)
+    elif extension == '.npz':
+        np.savez(filename, **dict(columns))
+    elif extension in ('.h5', '.hdf5'):
+        # optional dependency, only needed for HDF5 output
+        import h5py
+        with h5py.File(filename, 'w') as f:
+            for name, values in columns:
+                # HDF5 doesn't store numpy unicode strings
+                if values.dtype.kind == 'U':
+                    values = values.astype('S')
+                f.create_dataset(name, data=values)
+    else:
+        raise ValueError('unknown output format %r (use .csv, .npz or .h5)' % extension)
+
+def solve_modes(modes, m_values, n_values, c_values):
+    ''' (mode, m, n, c, chi) arrays for every combination of the values '''
+    m, n, c = [grid.ravel() for grid in
+               np.meshgrid(m_values, n_values, c_values, indexing='ij')]
+    columns = dict((name, []) for name in ('mode', 'm', 'n', 'c', 'chi'))
+    for mode in modes:
+        columns['mode'].append(np.repeat(mode, m.size))
+        columns['m'].append(m)
+        columns['n'].append(n)
+        columns['c'].append(c)
+        columns['chi'].append(find_roots(mode, m, n, c))
+    return [np.concatenate(columns[name]) for name in ('mode', 'm', 'n', 'c', 'chi')]
+
+def cutoff_table(modes, m_values, n_values, c_values,
+                 wavelength=LAMBDA, epsilon=EPSILON, mu=MU):
+    ''' columns (mode, m, n, c, chi, kz, cutoff_wavelength) for every combination
+        of the values, kz at the (free space) wavelength in the medium (epsilon, mu),
+        nan for modes that don't propagate '''
+    mode, m, n, c, chi = solve_modes(modes, m_values, n_values, c_values)
+    k = wavenumber(2*np.pi*C/wavelength, epsilon, mu)
+    with np.errstate(invalid='ignore'):
+        kz = np.sqrt(k**2 - chi**2)
+    return [('mode', mode), ('m', m), ('n', n), ('c', c), ('chi', chi), ('kz', kz),
+            ('cutoff_wavelength', cutoff_wavelength(chi, epsilon, mu))]
+
+def dispersion_table(modes, m_values, n_values, c_values, omega,
+                     epsilon=EPSILON, mu=MU):
+    ''' columns (mode, m, n, c, chi, omega, kz, alpha, group_velocity,
+        propagating) of shape (number of modes, number of frequencies) for every
+        combination of the values, at each angular frequency omega. Evanescent
+        modes have kz = 0 and decay as exp(-alpha z) '''
+    mode, m, n, c, chi = solve_modes(modes, m_values, n_values, c_values)
+    omega = np.asarray(omega, dtype=float)
+    kz, group_velocity, propagating = dispersion(chi[:,None], omega[None,:], epsilon, mu)
+    shape = kz.shape
+    columns = [('mode', mode), ('m', m), ('n', n), ('c', c), ('chi', chi)]
+    columns = [(name, np.repeat(values[:,None], shape[1], axis=1)) for name, values in columns]
+    return columns + [('omega', np.broadcast_to(omega, shape).copy()),
+                      ('kz', kz.real), ('alpha', np.abs(kz.imag)),
+                      ('group_velocity', group_velocity), ('propagating', propagating)]
+
+def mode_table(modes, c, wavelength, epsilon=EPSILON, mu=MU, max_modes=None):
+    ''' columns (mode, m, n, c, chi, kz, cutoff_wavelength) of the modes that
+        propagate at the (free space) wavelength, in order of cutoff '''
+    k = wavenumber(2*np.pi*C/wavelength, epsilon, mu)
+    found = propagating_modes(c, k, modes, max_modes)
+    mode = np.array([row[0] for row in found], dtype=str)
+    m, n = [np.array([row[i] for row in found], dtype=int) for i in (1, 2)]
+    chi = np.array([row[3] for row in found], dtype=float)
+    return [('mode', mode), ('m', m), ('n', n), ('c', np.repeat(float(c), chi.size)),
+            ('chi', chi), ('kz', np.sqrt(k**2 - chi**2)),
+            ('cutoff_wavelength', cutoff_wavelength(chi, epsilon, mu))]
+
+def field_grid(mode, n_rho, n_phi):
+    ''' columns (rho, phi, E_rho, ... H_y) of the mode's field on a grid '''
+    rho, phi = np.linspace(1, mode.c, n_rho), np.linspace(0, 2*np.pi, n_phi)
+    RHO, PHI = np.meshgrid(rho, phi)
+    F = mode.fields(rho[None,:], phi[:,None])
+    return [('rho', RHO), ('phi', PHI)] + list(zip(FIELD_COMPONENTS, F))
+
+def write_field_map(filename, mode, n_rho, n_phi):
+    ''' write the mode's field on a grid to a .npy file (memory-mapped) as an 
+        array fields[component, phi, rho] in the order of FIELD_COMPONENTS, 
+        with rho = linspace(1, c, n_rho) and phi = linspace(0, 2 pi, n_phi) '''
+    out = open_memmap(filename, mode='w+', dtype=float,
+                      shape=(len(FIELD_COMPONENTS), n_phi, n_rho))
+    field_map(mode, np.linspace(1, mode.c, n_rho), np.linspace(0, 2*np.pi, n_phi), out=out)
+    out.flush()
+    del out
+
+def run_table(args):
+    ''' the "table" command '''
+    columns = cutoff_table(args.mode, parse_values(args.m, int),
+                           parse_values(args.n, int), parse_values(args.c),
+                           args.wavelength, args.epsilon, args.mu)
+    write_columns(args.out, columns)
+    print('%s: %d modes' % (args.out, columns[-1][1].size))
+
+def run_dispersion(args):
+    ''' the "dispersion" command '''
+    limits = args.omega.split(':')
+    if len(limits) != 2:
+        raise SystemExit('--omega must be a range min:max')
+    omega = np.linspace(float(limits[0]), float(limits[1]), args.points)
+    columns = dispersion_table(args.mode, parse_values(args.m, int),
+                               parse_values(args.n, int), parse_values(args.c),
+                               omega, args.epsilon, args.mu)
+    write_columns(args.out, columns)
+    print('%s: %d modes x %d frequencies' % ((args.out,) + columns[0][1].shape))
+
+def run_modes(args):
+    ''' the "modes" command '''
+    try:
+        columns = mode_table(args.mode, args.c, args.wavelength, args.epsilon, args.mu,
+                             args.max_modes)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    write_columns(args.out, columns)
+    print('%s: %d propagating modes' % (args.out, columns[0][1].size))
+
+def run_fields(args):
+    ''' the "fields" command, writes a file per mode '''
+    modes = []
+    for name in args.mode:
+        if name == 'TEM':
+            modes.extend(TEMmode(c, args.wavelength, args.epsilon, args.mu)
+                         for c in parse_values(args.c))
+            continue
+        for m in parse_values(args.m, int):
+            for n in parse_values(args.n, int):
+                for c in parse_values(args.c):
+                    mode = MODES[name](m, n, c, args.wavelength, args.epsilon, args.mu)
+                    mode.find_root()
+                    if args.tol is not None:
+                        mode.use_interpolant(args.tol)
+                    modes.append(mode)
+
+    for mode in modes:
+        filename = args.out.format(mode=mode.mode, m=getattr(mode, 'm', 0),
+                                   n=getattr(mode, 'n', 0), c=mode.c)
+        if filename.lower().endswith('.npy'):
+            write_field_map(filename, mode, args.n_rho, args.n_phi)
+        else:
+            write_columns(filename, field_grid(mode, args.n_rho, args.n_phi))
+        print('%s: %s' % (filename, mode))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0].strip(" '"))
+    commands = parser.add_subparsers(dest='command')
+
+    table = commands.add_parser('table', help='table of roots chi_mn and kz')
+    table.add_argument('--mode', nargs='+', default=['TE', 'TM'], choices=sorted(MODES))
+    table.set_defaults(run=run_table)
+
+    spectrum = commands.add_parser('dispersion', help='kz, attenuation and group '
+                                   'velocity over a range of frequencies')
+    spectrum.add_argument('--mode', nargs='+', default=['TE', 'TM'], choices=sorted(MODES))
+    spectrum.add_argument('--omega', required=True,
+                          help='range of angular frequencies min:max (s-1)')
+    spectrum.add_argument('--points', type=int, default=1000, help='number of frequencies')
+    spectrum.set_defaults(run=run_dispersion)
+
+    modes = commands.add_parser('modes', help='the modes propagating at a wavelength, '
+                                'in order of cutoff')
+    modes.add_argument('--mode', nargs='+', default=['TE', 'TM'], choices=sorted(MODES))
+    modes.add_argument('--c', type=float, required=True, help='ratio of outer to inner radius')
+    modes.add_argument('--wavelength', type=float, required=True,
+                       help='free space wavelength of the light (m)')
+    modes.add_argument('--max-modes', type=int, default=None,
+                       help='only list this many of the lowest modes')
+    modes.add_argument('--out', default='modes.csv', help='output file (.csv, .npz or .h5)')
+    modes.set_defaults(run=run_modes)
+
+    fields = commands.add_parser('fields', help='field values sampled on a grid')
+    fields.add_argument('--mode', nargs='+', default=['TE', 'TM'],
+                        choices=sorted(MODES)+['TEM'])
+    fields.add_argument('--n-rho', type=int, default=15, help='number of radial points')
+    fields.add_argument('--n-phi', type=int, default=60, help='number of polar points')
+    fields.add_argument('--tol', type=float, default=None,
+                        help='evaluate the radial Bessel functions from Chebyshev series '
+                             'accurate to this (relative) tolerance')
+    fields.set_defaults(run=run_fields)
+
+    for command in (table, spectrum, modes, fields):
+        if command in (table, fields):
+            command.add_argument('--wavelength', type=float, default=LAMBDA,
+                                 help='free space wavelength of the light (m)')
+        command.add_argument('--epsilon', type=float, default=EPSILON,
+                             help='permittivity of the medium in the guide (F m-1)')
+        command.add_argument('--mu', type=float, default=MU,
+                             help='permeability of the medium in the guide (H m-1)')
+
+    for command, out in [(table, 'cutoffs.csv'), (spectrum, 'dispersion.npz'),
+                         (fields, 'fields_{mode}{m}{n}_c{c}.npz')]:
+        command.add_argument('--m', default='0', help='m values e.g. 0:10 or 0,2,4')
+        command.add_argument('--n', default='1', help='n values e.g. 1:5')
+        command.add_argument('--c', required=True, help='c values e.g. 1.5:4:0.5')
+        command.add_argument('--out', default=out, help='output file (.csv, .npz or .h5, '
+                             'or .npy for an array of just the fields)')
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
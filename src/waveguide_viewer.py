@@ -5,18 +5,81 @@
 from qtdesigner import Ui_WaveguideViewer_MainWindow
 
 # for coaxial modes logic
-from coaxial_modes import TMmode, TEmode, TEMmode
+from coaxial_modes import TMmode, TEmode, TEMmode, find_root_near
+# table of previously solved roots
+import root_cache
+# background thread for the heavy calculations
+from workers import ComputeThread
+# (opt-in) timings and counters
+import instrumentation
+from instrumentation import timed
 
 # Numpy module
 import numpy as np
 
+# copies of the mode for the background thread
+from copy import copy
+
 # for command-line arguments
 import sys
+# for timing bursts of redraw requests
+import time
 # Qt4 bindings for core Qt functionalities (non-GUI)
 from PyQt4 import QtCore
 # Python Qt4 bindings for GUI objects
 from PyQt4 import QtGui
 
+
+def calculate_root(mode, x):
+    ''' (mode, n, root) for the root of mode nearest x - run in the background '''
+    n, root = find_root_near(mode.mode, mode.m, mode.c, x)
+    return mode, n, root
+
+def calculate_field(mode, snapshot, n_rho, n_phi):
+    ''' (mode, n_rho, n_phi, field values) to plot - run in the background.
+        The field is worked out from snapshot, a copy of the mode taken when
+        the job was submitted, as the GUI thread may change the mode's root
+        while this runs (and working out the field caches things in the mode) '''
+    return mode, n_rho, n_phi, snapshot.field_arrows(n_rho, n_phi)
+
+
+class RedrawScheduler(QtCore.QObject):
+    ''' Coalesces bursts of requests (e.g. from holding down a spin box arrow) 
+        into single calls. Each scheduled function is called once, delay ms
+        after the last request, or at most max_delay ms after the first one 
+        so a long burst still shows progress '''
+    
+    def __init__(self, parent=None, delay=40, max_delay=200):
+        QtCore.QObject.__init__(self, parent)
+        self.max_delay = max_delay
+        self.pending = []           # functions to call, in the order requested
+        self.first_request = None   # time of the first request in this burst
+        
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        QtCore.QObject.connect(self.timer, QtCore.SIGNAL('timeout()'), self.flush)
+        
+    def schedule(self, function):
+        ''' call function once the current burst of requests is over '''
+        if function not in self.pending:
+            self.pending.append(function)
+        if self.first_request is None:
+            self.first_request = time.time()
+        
+        # put off the call for a bit longer, unless we've already waited too long
+        waited = 1000*(time.time() - self.first_request)
+        if waited < self.max_delay or not self.timer.isActive():
+            self.timer.start()
+    
+    def flush(self):
+        ''' call all the scheduled functions now '''
+        pending, self.pending = self.pending, []
+        self.first_request = None
+        self.timer.stop()
+        for function in pending:
+            function()
+
     
 class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
     '''Integrate Qt designer created window with program logic'''
@@ -35,6 +98,29 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         self.field_fig = self.field_canvas.fig
         self.field_ax = self.field_canvas.ax
         
+        # look roots up in the saved root table rather than solving every time
+        self.root_cache = root_cache.enable()
+        
+        # root solving and field calculations happen in a background thread,
+        # which sends the results back to job_finished
+        self.worker = ComputeThread(self)
+        QtCore.QObject.connect(self.worker, QtCore.
+                               SIGNAL('jobFinished(PyQt_PyObject)'), self.job_finished)
+        self.worker.start()
+        
+        # bursts of replot requests are coalesced into a single replot
+        self.scheduler = RedrawScheduler(self)
+        
+        # when profiling, time the canvas redraws and show the stats in the
+        # status bar every second
+        if instrumentation.ENABLED:
+            instrumentation.time_method(self.root_canvas, 'draw', 'root canvas draw')
+            instrumentation.time_method(self.field_canvas, 'draw', 'field canvas draw')
+            self.stats_timer = QtCore.QTimer(self)
+            QtCore.QObject.connect(self.stats_timer, QtCore.
+                                   SIGNAL('timeout()'), self.show_stats)
+            self.stats_timer.start(1000)
+        
         # set up the initial wave guide mode
         self.set_waveguide_mode()
         self.plot_root()
@@ -53,10 +139,9 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
                 
         # Root Calculator window
         # when pressing "recalculate root" 
+        # (the field is replotted once the new root has been found)
         QtCore.QObject.connect(self.recalculateRoot_pushButton, QtCore.
                                SIGNAL('clicked()'), self.click_recalculate_root)
-        QtCore.QObject.connect(self.recalculateRoot_pushButton, QtCore.
-                               SIGNAL('clicked()'), self.plot_field)
         # when pressing "enter" after editing the x range values 
         QtCore.QObject.connect(self.rootMinX_lineEdit, QtCore.
                                SIGNAL('returnPressed()'), self.set_new_x_range)
@@ -79,9 +164,14 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         QtCore.QObject.connect(self.H_field_checkBox, QtCore.
                                SIGNAL('stateChanged(int)'), self.click_field_checkbox)
         QtCore.QObject.connect(self.n_phi_spinBox, QtCore.
-                               SIGNAL('valueChanged(int)'), self.plot_field)
+                               SIGNAL('valueChanged(int)'), self.request_plot_field)
         QtCore.QObject.connect(self.n_rho_spinBox, QtCore.
-                               SIGNAL('valueChanged(int)'), self.plot_field)
+                               SIGNAL('valueChanged(int)'), self.request_plot_field)
+        
+        # "Animate" check box
+        self.animation = None
+        QtCore.QObject.connect(self.animate_checkBox, QtCore.
+                               SIGNAL('stateChanged(int)'), self.click_animate_checkbox)
                 
         # change the open tabbed window
         self.tabWidget.setCurrentIndex(0)
@@ -101,7 +191,12 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
             self.mode = TMmode(m,n,c)
         elif index == 2:
             self.mode = TEMmode(c)
+            return
+        
+        # solve for the nth root straight away, rather than starting at a guess
+        self.mode.find_root()
     
+    @timed('viewer.plot_root')
     def plot_root(self):
         ''' plots the radial root equation in the root equation axis '''
         self.root_ax.clear()
@@ -136,8 +231,9 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         ymin, ymax = 10**(log_range_factor) * np.array([self.root_ymin, 
                                                      self.root_ymax])
         self.root_ax.set_ylim(ymin, ymax)
-        self.root_canvas.draw()
+        self.root_canvas.draw_idle()
         
+    @timed('viewer.set_new_x_range')
     def set_new_x_range(self):
         ''' set a new x range in the root plot '''
         
@@ -152,27 +248,71 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
             self.rootMinX_lineEdit.setText(str(x_min))
             self.rootMaxX_lineEdit.setText(str(x_max))
             
+    def request_plot_field(self):
+        ''' replot the field once the current burst of changes has finished '''
+        self.scheduler.schedule(self.plot_field)
+        
+    @timed('viewer.plot_field')
     def plot_field(self):
-        ''' plot the field in the matplotlib axis '''
-        self.field_ax.clear()
+        ''' calculate the field in the background, to be plotted by show_field '''
         # how many points to plot
         n_phi = self.n_phi_spinBox.value()
         n_rho = self.n_rho_spinBox.value()
-        # plot the field
-        self.mode.plot_field(self.field_ax, n_rho=n_rho, n_phi=n_phi)
+        # replaces any field calculation that hasn't finished yet
+        self.worker.submit('field', calculate_field, self.mode, copy(self.mode), n_rho, n_phi)
+    
+    @timed('viewer.show_field')
+    def show_field(self, mode, n_rho, n_phi, values):
+        ''' plot the calculated field in the matplotlib axis '''
+        # the mode may have changed while the field was being calculated
+        if mode is not self.mode: return
+        
+        # plot the field (only the arrows are updated if this mode has already
+        # been plotted in the field axis)
+        self.mode.plot_field(self.field_ax, n_rho=n_rho, n_phi=n_phi, values=values)
+        self.field_ax = self.mode.field_ax
         # make we're only showing the desired fields
         # click_field_checkbox replots the H and E fields, but only plots those 
         # that have been checked off
         self.click_field_checkbox()
         
-        # Note a self.field_canvas.draw() is not necessary b/c click_field_checkbox
+        # animate the new field
+        if self.animate_checkBox.isChecked():
+            self.start_animation()
+        
+        # Note a self.field_canvas.draw_idle() is not necessary b/c click_field_checkbox
         # already performs that action
+    
+    def job_finished(self, job):
+        ''' a background calculation has finished, show its results '''
+        # ignore jobs that have since been replaced by newer ones
+        if not self.worker.is_current(job): return
+        
+        if job.name == 'root':
+            self.show_root(*job.get())
+        elif job.name == 'field':
+            self.show_field(*job.get())
          
+    @timed('viewer.click_recalculate_root')
     def click_recalculate_root(self):
         ''' what to do when recalculate root is clicked '''
+        if getattr(self.mode, 'drag', None) is None: return
         
-        # calculate the new root from the graph
-        self.mode.recalculate_root()
+        # calculate the new root (in the background) starting from the 
+        # dragged point on the graph
+        x = np.asarray(self.mode.drag.get_xdata()).item()
+        self.worker.submit('root', calculate_root, self.mode, x)
+    
+    @timed('viewer.show_root')
+    def show_root(self, mode, n, root):
+        ''' update the root plot (and then the field) with a newly calculated root '''
+        # the mode may have changed while the root was being calculated
+        if mode is not self.mode: return
+        
+        if np.isfinite(root):
+            self.mode.n = n
+            self.mode.set_root(float(root))
+        self.mode.show_root()
         
         # if this root is out of range of the x axis, update the x axis
         root = self.mode.root
@@ -184,6 +324,10 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
             
         self.mode.drag.draw()
         
+        # the field depends on the root
+        self.plot_field()
+        
+    @timed('viewer.click_more_x_points')
     def click_more_x_points(self):
         ''' what to do when "more x points" button is clicked in root calculator '''
         
@@ -202,6 +346,7 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         
         self.mode.rootplot.plot()
         
+    @timed('viewer.click_less_x_points')
     def click_less_x_points(self):
         ''' what to do when "less x points" button is clicked in root calculator '''
         
@@ -221,6 +366,7 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         
         self.mode.rootplot.plot()
                 
+    @timed('viewer.click_mode_ok')
     def click_mode_ok(self):
         ''' what to do when clicking "OK" for the mode selection screen 
             - change current mode information, goto plot to find root'''
@@ -228,13 +374,14 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         # if the previous mode was TE or TM then we need to disconnect all 
         # the events associated with finding the roots of their equations
         if self.mode.mode is not 'TEM':
-            # disconnect the previous signal / slot for the old mode
-            QtCore.QObject.disconnect(self.recalculateRoot_pushButton, 
-                                      QtCore.SIGNAL('clicked()'), 
-                                      self.mode.recalculate_root)
             # need to disconnect the matplotlib calls for mode
             self.mode.drag.disconnect()
         
+        # any calculations (and animation) for the old mode are no longer needed
+        self.worker.cancel('root')
+        self.worker.cancel('field')
+        self.stop_animation()
+        
         # update the mode info
         self.set_waveguide_mode()
         
@@ -245,10 +392,6 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
             self.tabWidget.setCurrentIndex(2)
             return
         
-        # connect signal / slot for the new updated mode
-        QtCore.QObject.connect(self.recalculateRoot_pushButton, QtCore.
-                               SIGNAL('clicked()'), self.mode.recalculate_root)
-        
         # change the open tabbed window
         self.tabWidget.setCurrentIndex(1)
         
@@ -296,6 +439,9 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         ''' what to do when clicking on the E_field and H_field check boxes in the
             field plot window. 
         '''
+        # nothing to show until the field has been plotted
+        if self.mode.E_field is None: return
+        
         # If E field is checked then the Electric field should be displayed 
         # (set its quiver to visible)
         if self.E_field_checkBox.isChecked():
@@ -308,7 +454,51 @@ class WaveGuideViewer(QtGui.QMainWindow, Ui_WaveguideViewer_MainWindow):
         else:
             self.mode.H_field.set_visible(False)
         
-        self.field_canvas.draw()
+        # redraw once control returns to the Qt event loop, so several changes
+        # in a row only cause one redraw
+        self.field_canvas.draw_idle()
+    
+    def click_animate_checkbox(self):
+        ''' start / stop animating the field plot '''
+        if self.animate_checkBox.isChecked():
+            self.start_animation()
+        else:
+            self.stop_animation()
+            # back to the (static) field at t = 0
+            self.plot_field()
+    
+    def start_animation(self):
+        ''' animate the plotted field through one period, over and over '''
+        self.stop_animation()
+        # nothing to animate until the field has been plotted
+        if self.mode.E_field is None: return
+        
+        # time-harmonic animation (only loaded if it's ever asked for)
+        from animation import FieldAnimation
+        
+        n_phi = self.n_phi_spinBox.value()
+        n_rho = self.n_rho_spinBox.value()
+        self.animation = FieldAnimation(self.mode, n_rho, n_phi)
+        self.animation.start(self.field_ax)
+    
+    def stop_animation(self):
+        ''' stop animating the field plot '''
+        if self.animation is not None:
+            self.animation.stop()
+            self.animation = None
+    
+    def show_stats(self):
+        ''' show the profiling timings and counters in the status bar '''
+        self.statusBar().showMessage(instrumentation.summary())
+    
+    def closeEvent(self, event):
+        ''' stop the background thread and save any newly solved roots to the
+            root table when closing (and the profiling stats, if asked for) '''
+        self.worker.stop()
+        self.root_cache.save()
+        if instrumentation.DUMP_FILENAME is not None:
+            instrumentation.dump(instrumentation.DUMP_FILENAME)
+        super(WaveGuideViewer, self).closeEvent(event)
           
 if __name__ == '__main__':
     # create the GUI application
@@ -0,0 +1,94 @@
+''' Background thread for running root solves and field evaluations off the
+    Qt main thread, so the waveguide viewer stays responsive '''
+
+import threading
+
+# Qt4 bindings for core Qt functionalities (non-GUI)
+from PyQt4 import QtCore
+
+
+class Job:
+    ''' A function call to be run in the background, and its outcome '''
+
+    def __init__(self, name, generation, function, args):
+        self.name = name                # jobs of the same name replace each other
+        self.generation = generation    # how many jobs of this name came before
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+
+    def run(self):
+        ''' call the function, keeping any exception to be raised later by get() '''
+        try:
+            self.result = self.function(*self.args)
+        except Exception as error:
+            self.error = error
+
+    def get(self):
+        ''' the result of the job (raises the exception if the job failed) '''
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class ComputeThread(QtCore.QThread):
+    ''' Runs jobs one at a time in a background thread.
+
+        Every job has a name, and only the latest job of each name matters:
+        submitting a job replaces any job of the same name that hasn't started
+        yet, and a job that's replaced while it's running has its result thrown
+        away. Finished jobs are posted back to the Qt main thread with the signal
+            jobFinished(PyQt_PyObject)  ->  the finished Job '''
+
+    def __init__(self, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.condition = threading.Condition()
+        self.pending = []       # jobs waiting to run, oldest first
+        self.generation = {}    # name -> generation of the latest job submitted
+        self.stopping = False
+
+    def submit(self, name, function, *args):
+        ''' run function(*args) in the background, replacing any waiting job of
+            the same name. Returns the Job '''
+        with self.condition:
+            generation = self.generation.get(name, 0) + 1
+            self.generation[name] = generation
+            job = Job(name, generation, function, args)
+            self.pending = [waiting for waiting in self.pending if waiting.name != name]
+            self.pending.append(job)
+            self.condition.notify()
+        return job
+
+    def cancel(self, name):
+        ''' drop any waiting job of this name, and ignore it if it's running '''
+        with self.condition:
+            self.generation[name] = self.generation.get(name, 0) + 1
+            self.pending = [waiting for waiting in self.pending if waiting.name != name]
+
+    def is_current(self, job):
+        ''' False if the job has been replaced by a newer job of the same name '''
+        with self.condition:
+            return self.generation.get(job.name) == job.generation
+
+    def run(self):
+        ''' the background thread: run jobs as they come in until stopped '''
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if self.stopping: return
+                job = self.pending.pop(0)
+
+            job.run()
+            # no need to tell anyone if a newer job has already been submitted
+            if self.is_current(job):
+                self.emit(QtCore.SIGNAL('jobFinished(PyQt_PyObject)'), job)
+
+    def stop(self):
+        ''' finish the current job (if any) and end the thread '''
+        with self.condition:
+            self.stopping = True
+            self.pending = []
+            self.condition.notify()
+        self.wait()